@@ -8,13 +8,19 @@ setup(
     install_requires=[
         'click>=8.0.0',
         'openai>=1.0.0',
+        'httpx>=0.23.0',
         'google-api-python-client>=2.0.0',
         'google-auth-oauthlib>=1.0.0',
         'python-dotenv>=0.19.0',
-        'PyYAML>=6.0.0',
+        'PyYAML>=6.0.0',  # Uses libyaml C bindings when PyYAML is built with them
         'tqdm>=4.65.0',
         'colorama>=0.4.6'  # For cross-platform colored terminal output
     ],
+    extras_require={
+        'http2': ['httpx[http2]>=0.23.0'],  # Multiplexed OpenAI connections
+        'semantic': ['numpy>=1.21.0'],  # --semantic-cache
+        'test': ['pytest>=7.0.0'],
+    },
     entry_points={
         'console_scripts': [
             'gmail-smart-label=smart_labeler.cli:main',
@@ -0,0 +1,246 @@
+from pathlib import Path
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+# Cached categories are trusted for 30 days
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+
+# Rows the in-memory embedding matrix starts with before it first grows
+INITIAL_CAPACITY = 256
+# New embeddings are written to the database in transactions of this many rows
+SAVE_BATCH_SIZE = 100
+
+def _invalidate_if_stale(conn: sqlite3.Connection, table: str, model: str, prompt_version: str) -> None:
+    """Empty a cache table when the stored model or prompt version differs"""
+    rows = dict(conn.execute("SELECT name, value FROM metadata").fetchall())
+    if rows.get('model') == model and rows.get('prompt_version') == prompt_version:
+        return
+
+    with conn:
+        conn.execute(f"DELETE FROM {table}")
+        conn.executemany(
+            "INSERT OR REPLACE INTO metadata(name, value) VALUES (?, ?)",
+            [('model', model), ('prompt_version', prompt_version)]
+        )
+
+class ClassificationCache:
+    def __init__(self, path: Path, model: str, prompt_version: str,
+                 max_age: int = DEFAULT_MAX_AGE):
+        """Initialize persistent classification cache
+
+        Args:
+            path: Location of the SQLite database file
+            model: Name of the model used for classification
+            prompt_version: Hash identifying the classification prompt
+            max_age: Seconds after which a cached category expires
+
+        Entries are dropped when the model or prompt version differs from
+        the one the cache was last populated with.
+        """
+        self.model = model
+        self.prompt_version = prompt_version
+        self.max_age = max_age
+        self._lock = threading.Lock()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache("
+            "key TEXT PRIMARY KEY, category TEXT, model TEXT, ts INTEGER)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS metadata(name TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._invalidate_if_stale()
+
+    def _invalidate_if_stale(self) -> None:
+        """Clear cached categories if model or prompt changed, and expired entries"""
+        _invalidate_if_stale(self._conn, 'cache', self.model, self.prompt_version)
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM cache WHERE ts < ?", (int(time.time()) - self.max_age,)
+            )
+
+    def key(self, email: Dict[str, str]) -> str:
+        """
+        Build cache key for an email
+
+        Args:
+            email: Email data as returned by GmailUtils
+
+        Returns:
+            Hex digest identifying the email content, model and prompt
+        """
+        parts = [
+            self.model,
+            self.prompt_version,
+            email.get('from', ''),
+            email.get('subject', ''),
+            email.get('body', '')[:300]
+        ]
+        return hashlib.sha256("\0".join(parts).encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up cached category
+
+        Args:
+            key: Cache key from key()
+
+        Returns:
+            Cached category name or None if not cached
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT category FROM cache WHERE key = ? AND ts >= ?",
+                (key, int(time.time()) - self.max_age)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, category: str) -> None:
+        """
+        Store category for a cache key
+
+        Args:
+            key: Cache key from key()
+            category: Category assigned to the email
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache(key, category, model, ts) VALUES (?, ?, ?, ?)",
+                (key, category, self.model, int(time.time()))
+            )
+
+    def close(self) -> None:
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
+
+class SemanticCache:
+    def __init__(self, path: Path, model: str, prompt_version: str, threshold: float = 0.92,
+                 max_age: int = DEFAULT_MAX_AGE):
+        """Initialize persistent embedding-based classification cache
+
+        Args:
+            path: Location of the SQLite database file
+            model: Name of the models used for embedding and classification
+            prompt_version: Hash identifying the classification prompt
+            threshold: Minimum cosine similarity for reusing a category
+            max_age: Seconds after which a stored embedding expires
+
+        Stored embeddings are kept in memory as a normalized matrix so a
+        lookup is a single matrix-vector product. The matrix grows by
+        doubling and new rows are written to the database in batches.
+        """
+        # numpy is only needed with --semantic-cache
+        try:
+            import numpy as np
+        except ImportError:
+            raise ImportError(
+                "The semantic cache needs numpy, install it with: pip install 'gmail-smart-labeler[semantic]'"
+            ) from None
+
+        self.threshold = threshold
+        self._lock = threading.Lock()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings("
+            "id INTEGER PRIMARY KEY, vector BLOB, category TEXT, ts INTEGER)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS metadata(name TEXT PRIMARY KEY, value TEXT)"
+        )
+        _invalidate_if_stale(self._conn, 'embeddings', model, prompt_version)
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE ts < ?", (int(time.time()) - max_age,)
+            )
+
+        rows = self._conn.execute("SELECT vector, category FROM embeddings ORDER BY id").fetchall()
+        self._categories: List[str] = [category for _, category in rows]
+        self._vectors = (
+            np.vstack([np.frombuffer(vector, dtype=np.float32) for vector, _ in rows])
+            if rows else None
+        )
+        self._size = len(rows)
+        self._unsaved: List[tuple] = []
+
+    @staticmethod
+    def _normalize(vector: List[float]):
+        """Convert an embedding to a unit-length float32 array"""
+        import numpy as np
+
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def lookup(self, vector: List[float]) -> Optional[str]:
+        """
+        Find the category of the most similar cached email
+
+        Args:
+            vector: Embedding of the email to classify
+
+        Returns:
+            Cached category if the nearest neighbour is similar enough, else None
+        """
+        import numpy as np
+
+        query = self._normalize(vector)
+        with self._lock:
+            if not self._size or self._vectors.shape[1] != query.shape[0]:
+                return None
+            similarities = self._vectors[:self._size] @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                return self._categories[best]
+        return None
+
+    def add(self, vector: List[float], category: str) -> None:
+        """
+        Store the embedding of a classified email
+
+        Args:
+            vector: Embedding of the email
+            category: Category assigned to the email
+        """
+        import numpy as np
+
+        array = self._normalize(vector)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.empty((INITIAL_CAPACITY, array.shape[0]), dtype=np.float32)
+            elif self._vectors.shape[1] != array.shape[0]:
+                return
+            elif self._size == len(self._vectors):
+                grown = np.empty((2 * len(self._vectors), array.shape[0]), dtype=np.float32)
+                grown[:self._size] = self._vectors
+                self._vectors = grown
+            self._vectors[self._size] = array
+            self._size += 1
+            self._categories.append(category)
+
+            self._unsaved.append((array.tobytes(), category, int(time.time())))
+            if len(self._unsaved) >= SAVE_BATCH_SIZE:
+                self._save()
+
+    def _save(self) -> None:
+        """Write embeddings added since the last save; the lock must be held"""
+        if self._unsaved:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO embeddings(vector, category, ts) VALUES (?, ?, ?)",
+                    self._unsaved
+                )
+            self._unsaved = []
+
+    def close(self) -> None:
+        """Write pending embeddings and close the underlying database connection"""
+        with self._lock:
+            self._save()
+            self._conn.close()
@@ -1,13 +1,12 @@
 import click
+import importlib.util
 import os
 import sys
 import subprocess
 from pathlib import Path
-from tqdm import tqdm
-from dotenv import load_dotenv, set_key
 import logging
+from .config import DEFAULT_CONCURRENCY
 from .logger import setup_logger
-from .core import GmailLabeler
 
 CONFIG_DIR = Path(__file__).parent / 'config'
 CONFIG_PATH = CONFIG_DIR / 'categories.yaml'
@@ -28,6 +27,8 @@ def cli():
 @cli.command()
 def configure():
     """Configure OpenAI API key."""
+    from dotenv import load_dotenv, set_key
+
     USER_CONFIG_DIR.mkdir(parents=True, exist_ok=True)
     
     logger.info("Starting configuration process")
@@ -59,6 +60,8 @@ def analyze():
     if CONFIG_PATH.exists() and not click.confirm('⚠️  This will delete existing Smart labels and generate new categories. Continue?'):
         return
 
+    from .core import GmailLabeler
+
     try:
         labeler = GmailLabeler()
         with click.progressbar(
@@ -104,19 +107,42 @@ def setup():
 
 @cli.command()
 @click.option('--dry-run', is_flag=True, help='Show what would be labeled without making changes.')
-def label(dry_run):
+@click.option('--concurrency', type=click.IntRange(min=1), default=DEFAULT_CONCURRENCY,
+              show_default=True, help='Number of emails classified in parallel.')
+@click.option('--semantic-cache', is_flag=True,
+              help='Reuse categories of similar emails using OpenAI embeddings.')
+@click.option('--prefilter', is_flag=True,
+              help='Label bulk mail as newsletters/marketing without asking OpenAI.')
+@click.option('--batch-api', is_flag=True,
+              help='Classify through the OpenAI Batch API: half the cost, may take up to 24 hours.')
+def label(dry_run, concurrency, semantic_cache, prefilter, batch_api):
     """Label emails using current configuration."""
+    if dry_run and batch_api:
+        raise click.UsageError('--batch-api submits a paid OpenAI batch job and cannot be combined with --dry-run.')
+    if semantic_cache and importlib.util.find_spec('numpy') is None:
+        raise click.UsageError(
+            "--semantic-cache needs numpy, install it with: pip install 'gmail-smart-labeler[semantic]'"
+        )
+
     if not CONFIG_PATH.exists():
         click.echo('❌ No configuration file found. Run "gmail-smart-label analyze" first.', err=True)
         return
 
+    from .core import GmailLabeler
+
     try:
         labeler = GmailLabeler()
         
         if dry_run:
             click.echo('(Dry run mode - no changes will be made)')
             
-        stats = labeler.label(dry_run=dry_run)
+        stats = labeler.label(
+            dry_run=dry_run,
+            concurrency=concurrency,
+            semantic_cache=semantic_cache,
+            prefilter=prefilter,
+            batch_api=batch_api
+        )
         
         click.echo('\n✅ Labeling complete!')
         click.echo(f"Processed: {stats['processed']} emails")
@@ -1 +1,5 @@
-"""Configuration management for Gmail Smart Labeler."""
\ No newline at end of file
+"""Configuration management for Gmail Smart Labeler."""
+
+# Number of classification requests sent to OpenAI in parallel. Kept here,
+# free of dependencies, so the CLI can show it without importing core.
+DEFAULT_CONCURRENCY = 8
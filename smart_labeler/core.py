@@ -1,17 +1,108 @@
 from pathlib import Path
 import yaml
+try:
+    # libyaml-backed implementations are much faster when available
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
 import os
+import hashlib
+import importlib.util
+import json
+import logging
+import random
+import re
+import textwrap
+import time
+from collections import Counter, defaultdict
+from email.utils import parseaddr
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+import httpx
 from dotenv import load_dotenv
-from openai import OpenAI
-from typing import Dict, Optional
+from openai import APIConnectionError, APITimeoutError, InternalServerError, OpenAI, RateLimitError
+from typing import Dict, List, Optional
 from .utils.auth import GmailAuthenticator
-from .utils.gmail import GmailUtils
+from .utils.gmail import GmailUtils, BATCH_SIZE
+from .utils.iterables import chunked
+from .utils.text import compact_body, estimate_tokens
+from .cache import ClassificationCache, SemanticCache
+from .config import DEFAULT_CONCURRENCY
+from .ratelimit import RateLimiter
 from tqdm import tqdm
 from .logger import setup_logger
 
 CONFIG_DIR = Path(__file__).parent / 'config'
 CONFIG_PATH = CONFIG_DIR / 'categories.yaml'
 PARENT_LABEL = "Smart Labels"
+# Category generation runs once per analysis and needs the stronger model,
+# per-email classification is a short 1-of-N choice that a small model handles
+CATEGORY_MODEL = "gpt-4o"
+CLASSIFIER_MODEL = "gpt-4o-mini"
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Number of emails classified together in a single OpenAI request
+CLASSIFY_BATCH_SIZE = 25
+
+# Pooled OpenAI connections are kept open between Gmail batch fetches so
+# classification requests reuse them instead of repeating the TLS handshake
+OPENAI_MAX_CONNECTIONS = 32
+OPENAI_KEEPALIVE_EXPIRY = 60
+# HTTP/2 multiplexes concurrent requests over one connection, but httpx
+# only supports it when the optional h2 package is installed
+OPENAI_HTTP2 = importlib.util.find_spec('h2') is not None
+
+# Minimum seconds between progress bar redraws
+PROGRESS_MININTERVAL = 0.5
+
+# Polling interval bounds while waiting for an OpenAI batch job (seconds)
+BATCH_POLL_MIN_DELAY = 10
+BATCH_POLL_MAX_DELAY = 300
+
+# Retries of the OpenAI client's own for Batch API file and job requests.
+# Chat completion and embedding requests are retried by _call_openai only.
+BATCH_API_RETRIES = 2
+
+# Exponential backoff settings for rate-limited or failed OpenAI requests (seconds)
+RETRY_ATTEMPTS = 6
+RETRY_BASE_DELAY = 1
+RETRY_MAX_DELAY = 60
+# Timed-out requests are retried at most this many times
+TIMEOUT_RETRIES = 2
+
+# Category names that bulk mail is labeled with when pre-filtering
+BULK_CATEGORY_NAMES = (
+    'newsletter', 'newsletters', 'marketing', 'promotion', 'promotions',
+    'promotional', 'bulk', 'mailing-list', 'mailing-lists'
+)
+
+# Keywords counted in email subjects during inbox analysis
+SUBJECT_KEYWORDS = (
+    'order', 'invoice', 'receipt', 'confirm', 'alert', 
+    'security', 'update', 'newsletter', 'subscription',
+    'payment', 'account', 'login', 'important', 'urgent',
+    'report', 'meeting', 'reminder', 'invitation'
+)
+
+# Content types detected from keywords in email bodies
+CONTENT_TYPES = (
+    ('transaction', ('order', 'payment', 'invoice', 'receipt')),
+    ('notification', ('notify', 'alert', 'warning')),
+    ('newsletter', ('newsletter', 'subscribe', 'unsubscribe')),
+    ('authentication', ('login', 'password', 'security', 'verify')),
+    ('social', ('connect', 'follow', 'share', 'join')),
+    ('calendar', ('meeting', 'appointment', 'schedule'))
+)
+CONTENT_KEYWORD_TYPES = {
+    keyword: ctype for ctype, keywords in CONTENT_TYPES for keyword in keywords
+}
+
+def _keyword_pattern(keywords) -> re.Pattern:
+    """Compile keywords into a case-insensitive single-pass pattern that also finds overlapping matches"""
+    alternatives = '|'.join(re.escape(k) for k in sorted(keywords, key=len, reverse=True))
+    return re.compile(f'(?=({alternatives}))', re.IGNORECASE)
+
+SUBJECT_PATTERN = _keyword_pattern(SUBJECT_KEYWORDS)
+CONTENT_PATTERN = _keyword_pattern(CONTENT_KEYWORD_TYPES)
 
 class GmailLabeler:
     def __init__(self):
@@ -31,7 +122,29 @@ class GmailLabeler:
             raise ValueError("OpenAI API key not found")
         
         self.logger.info("Initializing services...")
-        self.openai = OpenAI(api_key=api_key)
+        # Retries with backoff happen in _call_openai, not in the client
+        self.openai = OpenAI(
+            api_key=api_key,
+            max_retries=0,
+            http_client=httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+                    keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(60.0, connect=5.0),
+                http2=OPENAI_HTTP2
+            )
+        )
+        self.classifier_model = os.getenv('CLASSIFIER_MODEL', CLASSIFIER_MODEL)
+        rpm = os.getenv('OPENAI_RPM')
+        tpm = os.getenv('OPENAI_TPM')
+        self.rate_limiter = (
+            RateLimiter(float(rpm) if rpm else None, float(tpm) if tpm else None)
+            if rpm or tpm else None
+        )
+        self.cache: Optional[ClassificationCache] = None
+        self.semantic_cache: Optional[SemanticCache] = None
         
         # Initialize Gmail
         auth = GmailAuthenticator()
@@ -85,58 +198,51 @@ class GmailLabeler:
     def _analyze_patterns(self) -> Dict:
         """Analyze inbox for email patterns"""
         patterns = {
-            'senders': {},
-            'subjects': {},
-            'content_types': {}
+            'senders': Counter(),
+            'subjects': Counter(),
+            'content_types': Counter()
         }
         
-        # Get sample of recent emails
+        # Sender and subject patterns from headers of recent emails and content
+        # types from Gmail's snippet of their text, fetched while the message
+        # list is still being paged through
         messages = self.gmail_utils.get_all_messages(max_results=500)
-        self.logger.info(f"Analyzing patterns from {len(messages)} emails")
-        
-        for msg_id in tqdm(messages, desc="Processing emails", unit="email"):
-            email = self.gmail_utils.get_email_content(msg_id)
-            if email:
-                # Analyze sender
-                sender = email.get('from', '').lower()
-                if '@' in sender:
-                    domain = sender.split('@')[1]
-                    patterns['senders'][domain] = patterns['senders'].get(domain, 0) + 1
-                
-                # Analyze subject patterns
-                subject = email.get('subject', '').lower()
-                keywords = [
-                    'order', 'invoice', 'receipt', 'confirm', 'alert', 
-                    'security', 'update', 'newsletter', 'subscription',
-                    'payment', 'account', 'login', 'important', 'urgent',
-                    'report', 'meeting', 'reminder', 'invitation'
-                ]
-                for keyword in keywords:
-                    if keyword in subject:
-                        patterns['subjects'][keyword] = patterns['subjects'].get(keyword, 0) + 1
-                
-                # Analyze content types
-                body = email.get('body', '').lower()
-                content_types = [
-                    ('transaction', ['order', 'payment', 'invoice', 'receipt']),
-                    ('notification', ['notify', 'alert', 'warning']),
-                    ('newsletter', ['newsletter', 'subscribe', 'unsubscribe']),
-                    ('authentication', ['login', 'password', 'security', 'verify']),
-                    ('social', ['connect', 'follow', 'share', 'join']),
-                    ('calendar', ['meeting', 'appointment', 'schedule'])
-                ]
-                
-                for ctype, keywords in content_types:
-                    if any(keyword in body for keyword in keywords):
-                        patterns['content_types'][ctype] = patterns['content_types'].get(ctype, 0) + 1
+        total = 0
+        with tqdm(desc="Processing emails", unit="email", mininterval=PROGRESS_MININTERVAL) as pbar:
+            for chunk in chunked(messages, BATCH_SIZE):
+                emails = self.gmail_utils.get_email_contents_batch(chunk, format='metadata')
+                for email in emails.values():
+                    self._update_header_patterns(patterns, email)
+                    self._update_content_patterns(patterns, email)
+                total += len(chunk)
+                pbar.update(len(chunk))
+        self.logger.info(f"Analyzed patterns from {total} emails")
         
-        # Sort patterns by frequency
-        for key in patterns:
-            patterns[key] = dict(sorted(patterns[key].items(), key=lambda x: x[1], reverse=True)[:10])
+        # Keep the most frequent patterns
+        patterns = {key: dict(counts.most_common(10)) for key, counts in patterns.items()}
         
-        self.logger.debug(f"Pattern analysis results: {patterns}")
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(f"Pattern analysis results: {patterns}")
         return patterns
 
+    def _update_header_patterns(self, patterns: Dict[str, Counter], email: Dict) -> None:
+        """Update sender and subject counts"""
+        # Analyze sender
+        domain = self._sender_domain(email.get('from', ''))
+        if domain:
+            patterns['senders'][domain] += 1
+        
+        # Analyze subject patterns
+        subject = email.get('subject', '')
+        keywords = list(dict.fromkeys(m.lower() for m in SUBJECT_PATTERN.findall(subject)))
+        patterns['subjects'].update(keywords)
+
+    def _update_content_patterns(self, patterns: Dict[str, Counter], email: Dict) -> None:
+        """Update content type counts from the email body or snippet"""
+        body = email.get('body', '')
+        found = {CONTENT_KEYWORD_TYPES[keyword.lower()] for keyword in CONTENT_PATTERN.findall(body)}
+        patterns['content_types'].update(ctype for ctype, _ in CONTENT_TYPES if ctype in found)
+
     def _generate_categories(self, patterns: Dict) -> Dict:
         """Generate category suggestions using OpenAI"""
         self.logger.info("Generating category suggestions")
@@ -144,112 +250,266 @@ class GmailLabeler:
         Analyze these email patterns and suggest 6-8 clear, distinct categories.
         Each category should be simple and non-overlapping.
 
-        Patterns found:
-        {yaml.dump(patterns, sort_keys=False)}
+        Patterns found (count in parentheses):
+        {self._format_patterns(patterns)}
 
-        Create a YAML structure with these fields for each category:
-        categories:
-          category_name:
-            description: Brief description
-            priority: high/medium/low
+        Respond with a JSON object of this shape:
+        {{"categories": {{"category_name": {{"description": "Brief description", "priority": "high/medium/low"}}}}}}
 
         Rules:
         1. Categories must be distinct with no overlap
         2. Use single-word or hyphenated names
         3. Each category needs only a brief description (1-2 lines max)
-        4. Use only valid YAML without any markdown formatting
         """
 
         try:
             self.logger.debug("Sending request to OpenAI")
-            response = self.openai.chat.completions.create(
-                model="gpt-4-0125-preview",
+            response = self._create_completion(
+                model=CATEGORY_MODEL,
                 messages=[
-                    {"role": "system", "content": "You are a YAML generator. Output only valid YAML without markdown formatting or code blocks."},
+                    {"role": "system", "content": "You suggest email categories. Output only a JSON object."},
                     {"role": "user", "content": prompt}
                 ],
+                response_format={"type": "json_object"},
                 temperature=0.1,
                 max_tokens=500
             )
 
-            content = response.choices[0].message.content.strip()
-            # Remove any markdown formatting if present
-            if content.startswith('```'):
-                content = '\n'.join(content.split('\n')[1:-1])
-            
-            categories = yaml.safe_load(content)
+            categories = json.loads(response.choices[0].message.content)
             self.logger.info(f"Generated {len(categories.get('categories', {}))} categories")
             return categories
-        except yaml.YAMLError as e:
-            self.logger.error(f"Invalid YAML in OpenAI response: {str(e)}")
-            raise Exception(f"Invalid YAML in response: {str(e)}")
+        except json.JSONDecodeError as e:
+            self.logger.error(f"Invalid JSON in OpenAI response: {str(e)}")
+            raise Exception(f"Invalid JSON in response: {str(e)}")
         except Exception as e:
             self.logger.error(f"Error generating categories: {str(e)}")
             raise Exception(f"Error generating categories: {str(e)}")
 
+    def _format_patterns(self, patterns: Dict[str, Dict[str, int]]) -> str:
+        """Format pattern counts compactly, one line per pattern type"""
+        return '\n        '.join(
+            f"{key}: " + ', '.join(f"{name} ({count})" for name, count in counts.items())
+            for key, counts in patterns.items()
+        )
+
     def _save_config(self, categories: Dict) -> None:
         """Save categories to YAML config file"""
         try:
             self.logger.info(f"Saving configuration to {CONFIG_PATH}")
             with open(CONFIG_PATH, 'w') as f:
-                yaml.safe_dump(categories, f, default_flow_style=False, sort_keys=False)
+                yaml.dump(categories, f, Dumper=SafeDumper, default_flow_style=False, sort_keys=False)
             self.logger.info("Configuration saved successfully")
         except Exception as e:
             self.logger.error(f"Failed to save config: {str(e)}")
             raise Exception(f"Failed to save config: {str(e)}")
 
-    def label(self, dry_run: bool = False) -> Dict:
+    def label(self, dry_run: bool = False, concurrency: int = DEFAULT_CONCURRENCY,
+              semantic_cache: bool = False, prefilter: bool = False,
+              batch_api: bool = False) -> Dict:
         """Label emails using current configuration"""
         if not CONFIG_PATH.exists():
             raise FileNotFoundError("No configuration file found")
+        if dry_run and batch_api:
+            # The batch job is billed even though no labels are applied
+            raise ValueError("The OpenAI Batch API cannot be used in a dry run")
 
         try:
             with open(CONFIG_PATH, 'r') as f:
-                config = yaml.safe_load(f)
+                config = yaml.load(f, Loader=SafeLoader)
 
+            valid_categories = {name.lower(): name for name in config['categories']}
             prompt_template = self._generate_prompt(config)
+            batch_template = self._generate_batch_prompt(config)
             unlabeled = self._get_unlabeled_emails()
             total_emails = len(unlabeled)
 
             if total_emails == 0:
                 return {"processed": 0, "labeled": 0, "errors": 0}
 
+            prompt_version = hashlib.sha256(
+                (prompt_template + batch_template).encode('utf-8')
+            ).hexdigest()
+            self.cache = ClassificationCache(
+                self.user_config_dir / 'cache' / 'classifications.db',
+                model=self.classifier_model,
+                prompt_version=prompt_version
+            )
+            if semantic_cache:
+                self.semantic_cache = SemanticCache(
+                    self.user_config_dir / 'cache' / 'semantic.db',
+                    model=f"{EMBEDDING_MODEL}+{self.classifier_model}",
+                    prompt_version=prompt_version
+                )
+
+            # Bulk mail (List-Unsubscribe or Precedence: bulk headers) goes
+            # straight to a newsletter-like category without asking OpenAI
+            bulk_category = None
+            if prefilter:
+                bulk_category = next(
+                    (valid_categories[name] for name in BULK_CATEGORY_NAMES if name in valid_categories),
+                    None
+                )
+                if not bulk_category:
+                    self.logger.warning("No newsletter or marketing category configured, pre-filter disabled")
+            prefiltered = 0
+
             stats = {'processed': 0, 'labeled': 0, 'errors': 0}
             
-            with tqdm(total=total_emails, desc="Labeling emails", unit="email") as pbar:
-                for email_id in unlabeled:
-                    email = self.gmail_utils.get_email_content(email_id)
-                    if not email:
-                        stats['errors'] += 1
-                        self.logger.warning(f"Could not fetch email content for ID: {email_id}")
-                        pbar.update(1)
+            # Fetching the next batch from Gmail overlaps with classification of
+            # the previous one, which runs in the thread pool
+            with tqdm(total=total_emails, desc="Labeling emails", unit="email",
+                      mininterval=PROGRESS_MININTERVAL) as pbar, \
+                    ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+                in_flight = {}
+                groups = {}
+                group_categories = {}
+                # With the Batch API, classification waits until all emails are fetched
+                deferred = []
+                for chunk in chunked(unlabeled, BATCH_SIZE):
+                    # Gmail's snippet of the body is enough for classification
+                    emails = self.gmail_utils.get_email_contents_batch(chunk, format='metadata')
+
+                    fetched = []
+                    for email_id in chunk:
+                        email = emails.get(email_id)
+                        if not email:
+                            stats['errors'] += 1
+                            self.logger.warning(f"Could not fetch email content for ID: {email_id}")
+                            pbar.update(1)
+                            continue
+                        fetched.append(email)
+
+                    # Templated emails (same sender address and subject apart from
+                    # numbers) are classified once through a representative
+                    representatives = []
+                    known = {}
+                    for key, members in self._group_emails(fetched).items():
+                        groups[members[0]['id']] = (key, members)
+                        if key in group_categories:
+                            known[members[0]['id']] = group_categories[key]
+                        elif bulk_category and members[0].get('bulk'):
+                            known[members[0]['id']] = bulk_category
+                            prefiltered += len(members)
+                        else:
+                            representatives.append(members[0])
+
+                    futures = {}
+                    if known:
+                        future = Future()
+                        future.set_result(known)
+                        futures[future] = [groups[email_id][1][0] for email_id in known]
+                    for batch in chunked(representatives, CLASSIFY_BATCH_SIZE):
+                        if batch_api:
+                            future = Future()
+                            deferred.append((future, batch))
+                        else:
+                            future = executor.submit(
+                                self._classify_emails_batch, batch, batch_template, prompt_template,
+                                valid_categories
+                            )
+                        futures[future] = batch
+
+                    if batch_api:
+                        in_flight.update(futures)
                         continue
 
-                    category = self._classify_email(email, prompt_template)
-                    if category and not dry_run:
-                        if self._apply_label(email_id, category):
-                            stats['labeled'] += 1
-
-                    stats['processed'] += 1
-                    pbar.update(1)
-                    pbar.set_postfix(labeled=stats['labeled'], errors=stats['errors'])
-
+                    self._collect_classifications(
+                        in_flight, groups, group_categories, valid_categories, stats, pbar, dry_run
+                    )
+                    in_flight = futures
+
+                if deferred:
+                    categories = self._classify_with_batch_api(
+                        [batch for _, batch in deferred], batch_template, valid_categories
+                    )
+                    for future, batch in deferred:
+                        # Emails the job did not classify count as errors, like failed
+                        # fetches, and stay unlabeled until the next run. The batch
+                        # list is the one in in_flight, so they are not collected.
+                        for email in batch:
+                            if email['id'] not in categories:
+                                members = groups.pop(email['id'])[1]
+                                stats['errors'] += len(members)
+                                pbar.update(len(members))
+                        batch[:] = [email for email in batch if email['id'] in categories]
+                        future.set_result(categories)
+
+                self._collect_classifications(
+                    in_flight, groups, group_categories, valid_categories, stats, pbar, dry_run
+                )
+
+            if bulk_category:
+                self.logger.info(f"Pre-filter classified {prefiltered} bulk emails as {bulk_category}")
             return stats
 
         except Exception as e:
             self.logger.error(f"Labeling failed: {str(e)}", exc_info=True)
             raise
-
-    def _generate_prompt(self, config: Dict) -> str:
-        """Generate efficient classification prompt from config"""
-        self.logger.debug("Generating classification prompt")
+        finally:
+            if self.cache:
+                self.cache.close()
+                self.cache = None
+            if self.semantic_cache:
+                self.semantic_cache.close()
+                self.semantic_cache = None
+
+    def _collect_classifications(self, futures: Dict, groups: Dict, group_categories: Dict,
+                                 valid_categories: Dict[str, str], stats: Dict, pbar: tqdm,
+                                 dry_run: bool) -> None:
+        """Wait for submitted classification batches and apply the resulting labels"""
+        # Labels are applied from this thread only, the Gmail client is not thread-safe
+        by_category = defaultdict(list)
+        for future in as_completed(futures):
+            categories = future.result()
+            for email in futures[future]:
+                key, members = groups.pop(email['id'])
+                category = self._match_category(categories.get(email['id']), valid_categories)
+                if category:
+                    group_categories[key] = category
+                    by_category[category].extend(member['id'] for member in members)
+
+                stats['processed'] += len(members)
+                pbar.update(len(members))
+            pbar.set_postfix(labeled=stats['labeled'], errors=stats['errors'], refresh=False)
+
+        if by_category and not dry_run:
+            stats['labeled'] += self._apply_labels(by_category)
+            pbar.set_postfix(labeled=stats['labeled'], errors=stats['errors'])
+
+    @staticmethod
+    def _sender_domain(sender: str) -> str:
+        """Extract the lowercased domain from a From header such as 'Name <user@example.com>'"""
+        address = parseaddr(sender)[1]
+        return address.rpartition('@')[2].lower() if '@' in address else ''
+
+    @staticmethod
+    def _group_emails(emails: List[Dict]) -> Dict[tuple, List[Dict]]:
+        """Group emails by sender address and subject with numbers masked"""
+        # The full address rather than the domain, so different people at a
+        # shared domain such as gmail.com are never grouped together
+        groups = defaultdict(list)
+        for email in emails:
+            sender = parseaddr(email.get('from', ''))[1].lower()
+            subject = re.sub(r'\d+', '#', email.get('subject', '').lower())[:60]
+            groups[(sender, subject)].append(email)
+        return groups
+
+    def _format_categories(self, config: Dict) -> str:
+        """Format configured categories for use in prompts"""
         categories = []
         for name, details in config['categories'].items():
             categories.append(f"{name}: {details['description']}")
         
-        categories_text = ' | '.join(categories)
+        return ' | '.join(categories)
+
+    def _generate_prompt(self, config: Dict) -> str:
+        """Generate efficient classification prompt from config"""
+        self.logger.debug("Generating classification prompt")
+        categories_text = self._format_categories(config)
         
-        return f'''
+        # Static instructions come first and the email last, so the shared
+        # prefix can be served from OpenAI's prompt cache
+        return textwrap.dedent(f'''
         Categorize this email into EXACTLY ONE of these categories:
         {categories_text}
 
@@ -257,40 +517,75 @@ class GmailLabeler:
         1. Choose exactly one category
         2. When in doubt, choose the higher priority category
         3. Be decisive - no explanations needed
+        4. Return ONLY the category name, nothing else
 
         Email:
         From: {{sender}}
         Subject: {{subject}}
         Body excerpt: {{body}}
+        ''').strip()
 
-        Return ONLY the category name, nothing else.
-        '''
+    def _generate_batch_prompt(self, config: Dict) -> str:
+        """Generate prompt classifying several numbered emails at once"""
+        self.logger.debug("Generating batch classification prompt")
+        categories_text = self._format_categories(config)
 
-    def _apply_label(self, email_id: str, category: str) -> bool:
-        """Apply label to email"""
-        try:
-            self.logger.debug(f"Applying category '{category}' to email {email_id}")
-            # Create the full label path under Smart Labels/category
-            label = self.gmail_utils.get_or_create_label(category, PARENT_LABEL)
-            if label:
-                return self.gmail_utils.apply_label(email_id, label['id'])
-            return False
-        except Exception as e:
-            self.logger.error(f"Error applying label: {str(e)}")
-            return False
+        return textwrap.dedent(f'''
+        Categorize each numbered email below into EXACTLY ONE of these categories:
+        {categories_text}
+
+        Rules:
+        1. Choose exactly one category for every email
+        2. When in doubt, choose the higher priority category
+        3. Be decisive - no explanations needed
+        4. Return ONLY a JSON object mapping each email number to its category name,
+           for example {{{{"1": "category", "2": "category"}}}}
+
+        Emails:
+        {{emails}}
+        ''').strip()
+
+    def _match_category(self, category: Optional[str], valid_categories: Dict[str, str]) -> Optional[str]:
+        """Map a model answer to a configured category name, ignoring unknown answers"""
+        if not category:
+            return None
+        match = valid_categories.get(category.strip().strip('"\'.').lower())
+        if not match:
+            self.logger.warning(f"Ignoring unknown category returned by model: {category}")
+        return match
+
+    def _apply_labels(self, by_category: Dict[str, List[str]]) -> int:
+        """Apply category labels to emails, one request per category; returns emails labeled"""
+        labeled = 0
+        for category, email_ids in by_category.items():
+            try:
+                self.logger.debug(f"Applying category '{category}' to {len(email_ids)} emails")
+                label_id = self._get_label_id(category)
+                if label_id and self.gmail_utils.apply_label_bulk(email_ids, label_id):
+                    labeled += len(email_ids)
+            except Exception as e:
+                self.logger.error(f"Error applying label: {str(e)}")
+        return labeled
+
+    def _get_label_id(self, category: str) -> Optional[str]:
+        """Get the ID of the Smart Labels/category label, creating it if needed"""
+        label = self.gmail_utils.get_or_create_label(category, PARENT_LABEL)
+        return label['id'] if label else None
 
     def _delete_existing_labels(self) -> None:
         """Delete all existing Smart labels"""
         try:
             self.logger.info("Deleting existing Smart labels")
             # Only delete child labels, keep the parent
-            labels = self.gmail_service.users().labels().list(userId='me').execute()
-            for label in labels.get('labels', []):
+            labels = self.gmail_utils.get_labels()
+            label_ids = []
+            for label in labels:
                 if label['name'].startswith(f"{PARENT_LABEL}/"):
                     self.logger.debug(f"Deleting label: {label['name']}")
-                    self.gmail_service.users().labels().delete(
-                        userId='me', id=label['id']
-                    ).execute()
+                    label_ids.append(label['id'])
+            deleted = self.gmail_utils.delete_labels(label_ids)
+            if deleted < len(label_ids):
+                self.logger.warning(f"Deleted {deleted} of {len(label_ids)} labels")
             self.logger.info("Existing labels deleted successfully")
         except Exception as e:
             self.logger.error(f"Error deleting labels: {str(e)}")
@@ -300,48 +595,358 @@ class GmailLabeler:
         """Get list of emails without Smart labels"""
         try:
             self.logger.debug("Getting list of unlabeled emails")
-            # Get all emails with Smart labels
-            labeled = set()
-            labels = self.gmail_service.users().labels().list(userId='me').execute()
-            for label in labels.get('labels', []):
-                if label['name'].startswith(f"{PARENT_LABEL}/"):
-                    messages = self.gmail_utils.get_messages_with_label(label['id'])
-                    labeled.update(messages)
-
-            # Get all inbox messages
-            all_messages = set(self.gmail_utils.get_all_messages(label_ids=['INBOX']))
-            
-            # Get unlabeled messages
-            unlabeled = list(all_messages - labeled)
+            # Exclude every Smart label in the search query itself
+            labels = self.gmail_utils.get_labels()
+            exclusions = [
+                f"-label:{self._search_label_name(label['name'])}"
+                for label in labels
+                if label['name'].startswith(f"{PARENT_LABEL}/")
+            ]
+
+            # Get inbox messages without any Smart label. The IDs are collected
+            # up front: labeling while paging would change the query results.
+            unlabeled = list(self.gmail_utils.get_all_messages(
+                label_ids=['INBOX'],
+                query=' '.join(exclusions) or None
+            ))
             self.logger.debug(f"Found {len(unlabeled)} unlabeled emails")
             return unlabeled
         except Exception as e:
             self.logger.error(f"Error getting unlabeled emails: {str(e)}")
             raise
 
-    def _classify_email(self, email: Dict, prompt_template: str) -> Optional[str]:
+    @staticmethod
+    def _search_label_name(name: str) -> str:
+        """Convert a label name to the form used by Gmail search, e.g. smart-labels-work"""
+        return re.sub(r'[\s/]+', '-', name.lower())
+
+    def _classify_email(self, email: Dict, prompt_template: str,
+                        valid_categories: Dict[str, str]) -> Optional[str]:
         """Classify single email"""
         try:
+            cache_key = self.cache.key(email) if self.cache else None
+            if cache_key:
+                cached = self.cache.get(cache_key)
+                if cached:
+                    self.logger.debug("Cache hit, classified email as: %s", cached)
+                    return cached
+
             formatted_prompt = prompt_template.format(
                 sender=email.get('from', 'Unknown'),
                 subject=email.get('subject', 'No Subject'),
-                body=email.get('body', '')[:300]
+                body=compact_body(email.get('body', ''))
             )
 
-            response = self.openai.chat.completions.create(
-                model="gpt-4-0125-preview",
+            response = self._create_completion(
+                model=self.classifier_model,
                 messages=[
                     {"role": "system", "content": "You are an email classifier. Return only the category name."},
                     {"role": "user", "content": formatted_prompt}
                 ],
-                temperature=0.1,
+                temperature=0,
                 max_tokens=10
             )
 
-            category = response.choices[0].message.content.strip()
-            self.logger.debug(f"Classified email as: {category}")
+            # Only configured names are cached, an unknown answer is asked again next run
+            category = self._match_category(response.choices[0].message.content, valid_categories)
+            self.logger.debug("Classified email as: %s", category)
+            if cache_key and category:
+                self.cache.put(cache_key, category)
             return category
 
         except Exception as e:
             self.logger.error(f"Classification error: {str(e)}")
-            return None
\ No newline at end of file
+            return None
+
+    def _classify_emails_batch(self, emails: List[Dict], batch_template: str,
+                               prompt_template: str, valid_categories: Dict[str, str]) -> Dict[str, str]:
+        """Classify several emails with a single request, returning categories by email ID"""
+        results, pending, vectors = self._reuse_cached_categories(emails)
+        if not pending:
+            return results
+
+        if not self._request_categories(pending, batch_template, valid_categories, results):
+            # One request per email would fail the same way while OpenAI is
+            # unavailable, unclassified emails are left for the next run
+            self._remember_embeddings(pending, results, vectors)
+        else:
+            self._complete_batch(pending, results, vectors, prompt_template, valid_categories)
+        return results
+
+    def _request_categories(self, emails: List[Dict], batch_template: str,
+                            valid_categories: Dict[str, str], results: Dict[str, str]) -> bool:
+        """
+        Classify emails with one chat request, retrying in halves on malformed answers
+
+        Returns:
+            False if OpenAI stayed unavailable after retries, else True
+        """
+        try:
+            response = self._create_completion(
+                **self._batch_request(emails, batch_template, list(valid_categories.values()))
+            )
+            self._parse_batch_answer(response.choices[0].message.content, emails, results, valid_categories)
+        except json.JSONDecodeError as e:
+            self.logger.warning(f"Invalid JSON in batch classification response: {str(e)}")
+            if len(emails) > 1:
+                # Malformed answers are mostly truncated ones. Only the chat
+                # request is repeated, cache lookups and embeddings are not.
+                half = len(emails) // 2
+                return all([
+                    self._request_categories(part, batch_template, valid_categories, results)
+                    for part in (emails[:half], emails[half:])
+                ])
+        except (RateLimitError, APIConnectionError, InternalServerError) as e:
+            self.logger.error(f"OpenAI unavailable for batch classification: {str(e)}")
+            return False
+        except Exception as e:
+            self.logger.error(f"Batch classification error: {str(e)}")
+        return True
+
+    def _classify_with_batch_api(self, email_batches: List[List[Dict]], batch_template: str,
+                                 valid_categories: Dict[str, str]) -> Dict[str, str]:
+        """
+        Classify all email batches through one OpenAI Batch API job
+        
+        Emails whose request failed or was answered with unusable output are
+        left out of the result rather than classified one by one, which
+        would give up the Batch API's savings.
+        
+        Returns:
+            Categories by email ID
+        """
+        results = {}
+        jobs = []
+        lines = []
+        categories = list(valid_categories.values())
+        for number, emails in enumerate(email_batches):
+            cached, pending, vectors = self._reuse_cached_categories(emails)
+            results.update(cached)
+            if pending:
+                custom_id = f"batch-{number}"
+                jobs.append((custom_id, pending, vectors))
+                lines.append(json.dumps({
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": self._batch_request(pending, batch_template, categories)
+                }))
+
+        try:
+            answers = self._run_openai_batch('\n'.join(lines)) if lines else {}
+        except Exception as e:
+            # Cached categories are still used, the rest is left unclassified
+            self.logger.error(f"OpenAI batch classification failed: {str(e)}")
+            return results
+
+        missing = 0
+        for custom_id, pending, vectors in jobs:
+            batch_results = {}
+            if custom_id in answers:
+                try:
+                    self._parse_batch_answer(answers[custom_id], pending, batch_results, valid_categories)
+                except Exception as e:
+                    self.logger.warning(f"Invalid batch classification response: {str(e)}")
+            missing += len(pending) - len(batch_results)
+            self._remember_embeddings(pending, batch_results, vectors)
+            results.update(batch_results)
+
+        if missing:
+            self.logger.warning(f"OpenAI batch left {missing} emails unclassified")
+        return results
+
+    def _run_openai_batch(self, requests_jsonl: str) -> Dict[str, str]:
+        """Run chat completion requests as an OpenAI batch job, returning answers by custom ID"""
+        client = self.openai.with_options(max_retries=BATCH_API_RETRIES)
+        batch_file = client.files.create(
+            file=('classifications.jsonl', requests_jsonl.encode('utf-8')),
+            purpose='batch'
+        )
+        batch = client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint='/v1/chat/completions',
+            completion_window='24h'
+        )
+        self.logger.info(f"Submitted OpenAI batch {batch.id}, waiting for it to complete...")
+
+        delay = BATCH_POLL_MIN_DELAY
+        while batch.status not in ('completed', 'failed', 'expired', 'cancelled'):
+            time.sleep(delay)
+            delay = min(delay * 2, BATCH_POLL_MAX_DELAY)
+            batch = client.batches.retrieve(batch.id)
+            self.logger.debug("OpenAI batch %s status: %s", batch.id, batch.status)
+
+        if batch.status != 'completed' or not batch.output_file_id:
+            raise Exception(f"OpenAI batch {batch.id} ended with status '{batch.status}'")
+
+        answers = {}
+        for line in client.files.content(batch.output_file_id).text.splitlines():
+            try:
+                item = json.loads(line)
+                response = item.get('response') or {}
+                if response.get('status_code') == 200:
+                    answers[item['custom_id']] = response['body']['choices'][0]['message']['content']
+            except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+                self.logger.warning(f"Skipping malformed line in OpenAI batch output: {str(e)}")
+        self.logger.info(f"OpenAI batch {batch.id} completed")
+        return answers
+
+    def _reuse_cached_categories(self, emails: List[Dict]):
+        """Split emails into cached categories, emails still to classify and their embeddings"""
+        results = {}
+        pending = []
+        for email in emails:
+            cached = self.cache.get(self.cache.key(email)) if self.cache else None
+            if cached:
+                results[email['id']] = cached
+            else:
+                pending.append(email)
+
+        vectors = {}
+        if pending and self.semantic_cache:
+            vectors = self._lookup_similar(pending, results)
+            pending = [email for email in pending if email['id'] not in results]
+        return results, pending, vectors
+
+    def _batch_request(self, emails: List[Dict], batch_template: str, categories: List[str]) -> Dict:
+        """Build chat completion arguments classifying numbered emails in one request"""
+        lines = []
+        for number, email in enumerate(emails, start=1):
+            body = compact_body(email.get('body', ''))
+            lines.append(
+                f"{number}. From: {email.get('from', 'Unknown')} | "
+                f"Subject: {email.get('subject', 'No Subject')} | Body: {body}"
+            )
+
+        return {
+            "model": self.classifier_model,
+            "messages": [
+                {"role": "system", "content": "You are an email classifier. Return only a JSON object of category names."},
+                {"role": "user", "content": batch_template.format(emails='\n'.join(lines))}
+            ],
+            "temperature": 0,
+            "max_tokens": 20 * len(emails) + 20,
+            "response_format": self._batch_response_format(categories, len(emails))
+        }
+
+    def _parse_batch_answer(self, content: str, emails: List[Dict], results: Dict[str, str],
+                            valid_categories: Dict[str, str]) -> None:
+        """Store configured categories from a numbered JSON answer in results and the cache"""
+        parsed = json.loads(content)
+        for number, email in enumerate(emails, start=1):
+            answer = parsed.get(str(number))
+            category = self._match_category(answer, valid_categories) if isinstance(answer, str) else None
+            if category:
+                results[email['id']] = category
+                if self.cache:
+                    self.cache.put(self.cache.key(email), category)
+        self.logger.debug("Classified %d emails in one request", len(emails))
+
+    def _complete_batch(self, emails: List[Dict], results: Dict[str, str],
+                        vectors: Dict[str, List[float]], prompt_template: str,
+                        valid_categories: Dict[str, str]) -> None:
+        """Classify emails a batch answer missed one by one and remember new embeddings"""
+        for email in emails:
+            if email['id'] not in results:
+                category = self._classify_email(email, prompt_template, valid_categories)
+                if category:
+                    results[email['id']] = category
+
+        self._remember_embeddings(emails, results, vectors)
+
+    def _remember_embeddings(self, emails: List[Dict], results: Dict[str, str],
+                             vectors: Dict[str, List[float]]) -> None:
+        """Add embeddings of newly classified emails to the semantic cache"""
+        for email in emails:
+            if email['id'] in vectors and email['id'] in results:
+                self.semantic_cache.add(vectors[email['id']], results[email['id']])
+
+    @staticmethod
+    def _batch_response_format(categories: List[str], count: int) -> Dict:
+        """Build a JSON schema restricting every numbered answer to a known category"""
+        answer = {"type": "string", "enum": categories}
+        numbers = [str(number) for number in range(1, count + 1)]
+        return {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "classifications",
+                "strict": True,
+                "schema": {
+                    "type": "object",
+                    "properties": {number: answer for number in numbers},
+                    "required": numbers,
+                    "additionalProperties": False
+                }
+            }
+        }
+
+    def _lookup_similar(self, emails: List[Dict], results: Dict[str, str]) -> Dict[str, List[float]]:
+        """Reuse categories of similar, already classified emails; returns embeddings by email ID"""
+        try:
+            texts = [
+                f"{email.get('from', '')}\n{email.get('subject', '')}\n{compact_body(email.get('body', ''))}"
+                for email in emails
+            ]
+            response = self._call_openai(
+                self.openai.embeddings.create,
+                sum(estimate_tokens(text) for text in texts),
+                model=EMBEDDING_MODEL,
+                input=texts
+            )
+        except Exception as e:
+            self.logger.error(f"Embedding error: {str(e)}")
+            return {}
+
+        vectors = {}
+        for email, item in zip(emails, sorted(response.data, key=lambda d: d.index)):
+            category = self.semantic_cache.lookup(item.embedding)
+            if category:
+                self.logger.debug("Semantic cache hit, classified email as: %s", category)
+                results[email['id']] = category
+                if self.cache:
+                    self.cache.put(self.cache.key(email), category)
+            else:
+                vectors[email['id']] = item.embedding
+        return vectors
+
+    def _create_completion(self, **kwargs):
+        """Create a chat completion, retried like every other OpenAI request"""
+        # Prompt plus the most the answer may use, as counted against token limits
+        tokens = sum(
+            estimate_tokens(message['content']) for message in kwargs.get('messages', [])
+        ) + kwargs.get('max_tokens', 0)
+        response = self._call_openai(self.openai.chat.completions.create, tokens, **kwargs)
+        self._log_usage(response)
+        return response
+
+    def _call_openai(self, create, tokens: int = 0, **kwargs):
+        """Call an OpenAI endpoint, backing off exponentially on rate limits and transient errors"""
+        delay = RETRY_BASE_DELAY
+        timeouts = 0
+        for attempt in range(1, RETRY_ATTEMPTS + 1):
+            try:
+                if self.rate_limiter:
+                    self.rate_limiter.acquire(tokens)
+                return create(**kwargs)
+            except (RateLimitError, APIConnectionError, InternalServerError) as e:
+                # Timeouts are connection errors too. Each one has already waited
+                # out the read timeout, so they are retried fewer times.
+                if isinstance(e, APITimeoutError):
+                    timeouts += 1
+                if attempt == RETRY_ATTEMPTS or timeouts > TIMEOUT_RETRIES:
+                    raise
+                wait = min(delay, RETRY_MAX_DELAY) * random.uniform(0.5, 1.5)
+                self.logger.debug(
+                    f"OpenAI request failed ({type(e).__name__}), retrying in {wait:.1f}s (attempt {attempt})"
+                )
+                time.sleep(wait)
+                delay *= 2
+
+    def _log_usage(self, response) -> None:
+        """Log prompt token usage, including tokens served from the prompt cache"""
+        usage = getattr(response, 'usage', None)
+        if not usage:
+            return
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached = getattr(details, 'cached_tokens', 0) or 0
+        self.logger.debug("Prompt tokens: %d (%d cached)", usage.prompt_tokens, cached)
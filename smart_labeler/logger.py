@@ -1,5 +1,6 @@
 from pathlib import Path
 import logging
+from logging.handlers import MemoryHandler
 import sys
 from datetime import datetime
 
@@ -24,60 +25,66 @@ class ColoredFormatter(logging.Formatter):
 
     RESET = '\033[0m'
 
-    def format(self, record):
-        # Add emoji and color if it's a terminal
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Add emoji and color if it's a terminal; checked once, not per record
         if sys.stdout.isatty():
-            emoji = self.EMOJIS.get(record.levelname, '')
-            color = self.COLORS.get(record.levelname, '')
-            reset = self.RESET
+            self._prefixes = {
+                level: f"{color}{self.EMOJIS[level]} " for level, color in self.COLORS.items()
+            }
+            self._reset = self.RESET
         else:
-            emoji = ''
-            color = ''
-            reset = ''
+            self._prefixes = {}
+            self._reset = ''
 
-        # Format time in a readable way
-        record.asctime = datetime.fromtimestamp(record.created).strftime('%Y-%m-%d %H:%M:%S')
-        
-        # Create the basic message
-        message = super().format(record)
+    def format(self, record):
+        prefix = self._prefixes.get(record.levelname, ' ')
         
         # Add colors and emojis for terminal output
-        return f"{color}{emoji} {message}{reset}"
+        return f"{prefix}{super().format(record)}{self._reset}"
 
 def setup_logger(user_config_dir: Path) -> logging.Logger:
     """Setup application logging with singleton pattern"""
     logger_name = 'gmail_smart_labeler'
     
-    # Return existing logger if already set up
-    if logger_name in logging.root.manager.loggerDict:
-        return logging.getLogger(logger_name)
-    
+    # Modules create the logger on import, so it counts as set up only
+    # once it has handlers
     logger = logging.getLogger(logger_name)
+    if logger.handlers:
+        return logger
+
     logger.setLevel(logging.INFO)
     
-    # Only add handlers if they haven't been added yet
-    if not logger.handlers:
-        # Create logs directory if it doesn't exist
-        log_dir = user_config_dir / 'logs'
-        log_dir.mkdir(parents=True, exist_ok=True)
+    # Create logs directory if it doesn't exist
+    log_dir = user_config_dir / 'logs'
+    log_dir.mkdir(parents=True, exist_ok=True)
+
+    # File handler for complete logging
+    log_file = log_dir / f"smart_labeler_{datetime.now().strftime('%Y%m%d')}.log"
+    file_handler = logging.FileHandler(log_file)
+    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(logging.Formatter(
+        '%(asctime)s [%(levelname)s] %(message)s'
+    ))
 
-        # File handler for complete logging
-        log_file = log_dir / f"smart_labeler_{datetime.now().strftime('%Y%m%d')}.log"
-        file_handler = logging.FileHandler(log_file)
-        file_handler.setLevel(logging.DEBUG)
-        file_handler.setFormatter(logging.Formatter(
-            '%(asctime)s [%(levelname)s] %(message)s'
-        ))
+    # Console handler with colors and emojis
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(ColoredFormatter(
+        '%(message)s'
+    ))
 
-        # Console handler with colors and emojis
-        console_handler = logging.StreamHandler(sys.stdout)
-        console_handler.setLevel(logging.INFO)
-        console_handler.setFormatter(ColoredFormatter(
-            '%(message)s'
-        ))
+    # Buffer file records so they are written in blocks rather than one
+    # write per record; errors are written out immediately. Buffered
+    # records are flushed when logging shuts down at exit.
+    buffered_handler = MemoryHandler(
+        capacity=512,
+        flushLevel=logging.ERROR,
+        target=file_handler
+    )
 
-        # Add handlers to logger
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
+    # Add handlers to logger
+    logger.addHandler(buffered_handler)
+    logger.addHandler(console_handler)
 
     return logger
\ No newline at end of file
@@ -0,0 +1,62 @@
+import threading
+import time
+from typing import Optional
+
+class _Bucket:
+    def __init__(self, per_minute: float):
+        """Token bucket refilled continuously at a per-minute rate
+
+        The bucket holds one second worth of capacity, so short bursts
+        are allowed but the per-minute rate is never exceeded.
+        """
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate)
+        self.available = self.capacity
+        self.last_update = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        """Add capacity accumulated since the last update"""
+        self.available = min(self.capacity, self.available + (now - self.last_update) * self.rate)
+        self.last_update = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount can be taken, capped at the bucket capacity"""
+        needed = min(amount, self.capacity)
+        return max(0.0, (needed - self.available) / self.rate)
+
+class RateLimiter:
+    def __init__(self, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None):
+        """Initialize token-bucket limiter shared by worker threads
+
+        Args:
+            requests_per_minute: Sustained request rate to stay under
+            tokens_per_minute: Sustained token rate to stay under
+
+        A request larger than one second worth of tokens is let through
+        once the bucket is full and leaves it in debt, which later
+        requests wait out.
+        """
+        self._requests = _Bucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = _Bucket(tokens_per_minute) if tokens_per_minute else None
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int = 0) -> None:
+        """Block until a request using the given number of tokens may be sent"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = 0.0
+                if self._requests:
+                    self._requests.refill(now)
+                    wait = max(wait, self._requests.wait_time(1))
+                if self._tokens:
+                    self._tokens.refill(now)
+                    wait = max(wait, self._tokens.wait_time(tokens))
+                if wait == 0:
+                    if self._requests:
+                        self._requests.available -= 1
+                    if self._tokens:
+                        self._tokens.available -= tokens
+                    return
+            time.sleep(wait)
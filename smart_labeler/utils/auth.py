@@ -1,10 +1,11 @@
 from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
+import logging
 import os
 import pickle
 
+logger = logging.getLogger('gmail_smart_labeler')
+
 class GmailAuthenticator:
     def __init__(self, scopes=None):
         """Initialize authenticator with custom scopes"""
@@ -16,7 +17,9 @@ class GmailAuthenticator:
         
         # Create config directory in user's home
         self.CONFIG_DIR = os.path.join(os.path.expanduser('~'), '.gmail-smart-labeler')
-        self.TOKEN_PATH = os.path.join(self.CONFIG_DIR, 'token.pickle')
+        self.TOKEN_PATH = os.path.join(self.CONFIG_DIR, 'token.json')
+        # Tokens were stored pickled by earlier versions
+        self.LEGACY_TOKEN_PATH = os.path.join(self.CONFIG_DIR, 'token.pickle')
         self.CREDENTIALS_PATH = os.path.join(self.CONFIG_DIR, 'credentials.json')
         
         # Ensure config directory exists
@@ -29,13 +32,15 @@ class GmailAuthenticator:
         try:
             # Try to load existing credentials
             if os.path.exists(self.TOKEN_PATH):
-                with open(self.TOKEN_PATH, 'rb') as token:
-                    creds = pickle.load(token)
+                creds = Credentials.from_authorized_user_file(self.TOKEN_PATH, self.SCOPES)
+            elif os.path.exists(self.LEGACY_TOKEN_PATH):
+                creds = self._migrate_legacy_token()
 
             # If credentials are invalid or don't exist, handle authentication
             if not creds or not creds.valid:
                 if creds and creds.expired and creds.refresh_token:
-                    print("Refreshing expired credentials...")
+                    from google.auth.transport.requests import Request
+                    logger.info("Refreshing expired credentials...")
                     creds.refresh(Request())
                 else:
                     # Check if credentials file exists
@@ -50,20 +55,21 @@ class GmailAuthenticator:
                             f"5. Save it to: {self.CREDENTIALS_PATH}"
                         )
                     
-                    print("Initiating OAuth2 authorization flow...")
+                    # The OAuth flow is only needed on first authorization
+                    from google_auth_oauthlib.flow import InstalledAppFlow
+                    logger.info("Initiating OAuth2 authorization flow...")
                     flow = InstalledAppFlow.from_client_secrets_file(
                         self.CREDENTIALS_PATH, self.SCOPES)
                     creds = flow.run_local_server(port=0)
 
                 # Save valid credentials
-                with open(self.TOKEN_PATH, 'wb') as token:
-                    pickle.dump(creds, token)
-                print("Credentials saved successfully.")
+                self._save_token(creds)
+                logger.info("Credentials saved successfully.")
 
             return build('gmail', 'v1', credentials=creds)
 
         except Exception as e:
-            print(f"\nAuthentication error: {str(e)}")
+            logger.error(f"Authentication error: {str(e)}")
             if "credentials" in str(e).lower():
                 print("\nMake sure you have:")
                 print("1. Created a project in Google Cloud Console")
@@ -71,4 +77,18 @@ class GmailAuthenticator:
                 print("3. Created OAuth 2.0 credentials")
                 print("4. Downloaded the credentials JSON file")
                 print(f"5. Saved it as: {self.CREDENTIALS_PATH}")
-            raise
\ No newline at end of file
+            raise
+
+    def _save_token(self, creds: Credentials) -> None:
+        """Write credentials to the JSON token file"""
+        with open(self.TOKEN_PATH, 'w') as token:
+            token.write(creds.to_json())
+
+    def _migrate_legacy_token(self) -> Credentials:
+        """Convert a pickled token from an earlier version to JSON and remove it"""
+        logger.info("Migrating saved credentials to token.json...")
+        with open(self.LEGACY_TOKEN_PATH, 'rb') as token:
+            creds = pickle.load(token)
+        self._save_token(creds)
+        os.remove(self.LEGACY_TOKEN_PATH)
+        return creds
@@ -1,10 +1,44 @@
 from base64 import urlsafe_b64decode
 import email
 import json
-from typing import Dict, Optional, Set, List
+import logging
+from typing import Dict, Iterator, Optional, List
+import httplib2
 from googleapiclient.discovery import Resource
 from googleapiclient.errors import HttpError
 
+logger = logging.getLogger('gmail_smart_labeler')
+
+# Maximum number of requests sent in a single batch HTTP call. Gmail accepts
+# up to 100 but rate-limits larger batches, and recommends at most 50.
+BATCH_SIZE = 50
+
+# Parts of a full message resource used by _parse_message. Snippet, label
+# and size fields and the headers of top-level parts are not downloaded.
+# GmailLabeler only makes metadata fetches; format='full' and the body
+# decoding below remain part of the GmailUtils API for other callers.
+MESSAGE_FIELDS = 'payload(mimeType,headers,body/data,parts(mimeType,body/data,parts))'
+
+# Headers requested by metadata fetches, enough for sender, subject and
+# bulk mail detection
+METADATA_HEADERS = ['From', 'Subject', 'List-Unsubscribe', 'Precedence']
+
+# Retries for requests failing with 429 or 5xx; googleapiclient backs off
+# exponentially with jitter between attempts
+NUM_RETRIES = 5
+
+# Bodies of format='full' fetches are decoded up to this many bytes. Only
+# the start of a body is needed, and the limit avoids decoding the whole
+# of very large HTML emails.
+MAX_BODY_BYTES = 64 * 1024
+
+# Maximum number of message IDs accepted by messages.batchModify
+MODIFY_BATCH_SIZE = 1000
+
+# Network failures a batch HTTP call can raise besides HttpError, such as
+# socket timeouts, reset connections and unresolvable hosts
+TRANSPORT_ERRORS = (OSError, httplib2.HttpLib2Error)
+
 class GmailUtils:
     def __init__(self, service: Resource):
         """Initialize Gmail utilities
@@ -13,72 +47,190 @@ class GmailUtils:
             service: Authenticated Gmail API service resource
         """
         self.service = service
+        self._labels_by_name: Optional[Dict[str, Dict]] = None
 
-    def get_email_content(self, message_id: str) -> Optional[Dict[str, str]]:
+    def get_email_content(self, message_id: str, format: str = 'full') -> Optional[Dict[str, str]]:
         """Get email content with robust error handling
         
         Args:
             message_id: The ID of the message to retrieve
+            format: 'full' to include the body, 'metadata' for headers and Gmail's snippet
             
         Returns:
             Dictionary containing email data or None if error
         """
         try:
-            message = self.service.users().messages().get(
-                userId='me',
-                id=message_id,
-                format='full'
-            ).execute()
-
-            email_data = {
-                'id': message_id,
-                'subject': 'No Subject',
-                'from': 'No Sender',
-                'body': 'No Content'
-            }
-
-            headers = message.get('payload', {}).get('headers', [])
-            for header in headers:
-                name = header.get('name', '').lower()
-                if name == 'subject':
-                    email_data['subject'] = header.get('value', 'No Subject')
-                elif name == 'from':
-                    email_data['from'] = header.get('value', 'No Sender')
-
-            payload = message.get('payload', {})
-            body = ''
-
-            def get_body_from_payload(part: Dict) -> str:
-                if 'body' in part and 'data' in part['body']:
-                    return urlsafe_b64decode(part['body']['data']).decode('utf-8', errors='ignore')
-                return ''
-
-            if 'parts' in payload:
-                for part in payload['parts']:
-                    mime_type = part.get('mimeType', '')
-                    if 'text/plain' in mime_type:
-                        body = get_body_from_payload(part)
-                        break
-                
-                if not body:
-                    for part in payload['parts']:
-                        mime_type = part.get('mimeType', '')
-                        if 'text/html' in mime_type:
-                            body = get_body_from_payload(part)
-                            break
-            else:
-                body = get_body_from_payload(payload)
-
-            email_data['body'] = body if body else 'No Content'
-            return email_data
+            message = self._get_message_request(message_id, format).execute(num_retries=NUM_RETRIES)
+            return self._parse_message(message_id, message)
 
         except HttpError as e:
-            print(f"Gmail API error getting message {message_id}: {str(e)}")
+            logger.error(f"Gmail API error getting message {message_id}: {str(e)}")
             return None
         except Exception as e:
-            print(f"Error processing message {message_id}: {str(e)}")
+            logger.error(f"Error processing message {message_id}: {str(e)}")
             return None
 
+    def get_email_contents_batch(self, message_ids: List[str],
+                                 format: str = 'full') -> Dict[str, Dict[str, str]]:
+        """
+        Get content for many emails using batched HTTP requests
+        
+        Args:
+            message_ids: IDs of the messages to retrieve
+            format: 'full' to include bodies, 'metadata' for headers and Gmail's snippet
+            
+        Returns:
+            Dictionary mapping message ID to email data. Messages that
+            could not be retrieved are omitted.
+        """
+        emails = {}
+        failed = []
+
+        def callback(request_id: str, response: Dict, exception: Optional[Exception]) -> None:
+            if exception is not None:
+                failed.append(request_id)
+                return
+            try:
+                emails[request_id] = self._parse_message(request_id, response)
+            except Exception as e:
+                logger.error(f"Error processing message {request_id}: {str(e)}")
+
+        for start in range(0, len(message_ids), BATCH_SIZE):
+            batch = self.service.new_batch_http_request(callback=callback)
+            for message_id in message_ids[start:start + BATCH_SIZE]:
+                batch.add(self._get_message_request(message_id, format), request_id=message_id)
+            try:
+                batch.execute()
+            except (HttpError, *TRANSPORT_ERRORS) as e:
+                # Unfinished messages of the slice are retried one by one below
+                logger.error(f"Gmail API error executing batch: {str(e)}")
+                failed.extend(
+                    mid for mid in message_ids[start:start + BATCH_SIZE]
+                    if mid not in emails and mid not in failed
+                )
+
+        # Retry failed batch entries one by one
+        for message_id in failed:
+            email_data = self.get_email_content(message_id, format)
+            if email_data:
+                emails[message_id] = email_data
+
+        return emails
+
+    def _get_message_request(self, message_id: str, format: str):
+        """Build a messages.get request for the given format"""
+        if format == 'metadata':
+            return self.service.users().messages().get(
+                userId='me',
+                id=message_id,
+                format='metadata',
+                metadataHeaders=METADATA_HEADERS,
+                fields='snippet,payload/headers'
+            )
+        return self.service.users().messages().get(
+            userId='me',
+            id=message_id,
+            format=format,
+            fields=MESSAGE_FIELDS
+        )
+
+    def _parse_message(self, message_id: str, message: Dict) -> Dict[str, str]:
+        """
+        Extract subject, sender and body from a Gmail message resource
+        
+        Args:
+            message_id: The ID of the message
+            message: Message resource returned by the Gmail API
+            
+        Returns:
+            Dictionary containing email data
+        """
+        headers = {
+            header.get('name', '').lower(): header.get('value', '')
+            for header in message.get('payload', {}).get('headers', [])
+        }
+        email_data = {
+            'id': message_id,
+            'subject': headers.get('subject', 'No Subject'),
+            'from': headers.get('from', 'No Sender'),
+            'body': 'No Content',
+            # Mailing-list and bulk mail headers
+            'bulk': 'list-unsubscribe' in headers
+                    or headers.get('precedence', '').lower() in ('bulk', 'list')
+        }
+
+        payload = message.get('payload', {})
+        if 'parts' in payload:
+            part = self._find_body_part(payload)
+            body = self._decode_body(part) if part else ''
+        else:
+            body = self._decode_body(payload)
+        if not body:
+            # Metadata fetches carry Gmail's HTML-escaped preview of the text.
+            # It stays escaped so compact_body strips real tags before
+            # unescaping, and escaped text such as '3 &lt; 5' survives.
+            body = message.get('snippet', '')
+
+        email_data['body'] = body if body else 'No Content'
+        return email_data
+
+    @staticmethod
+    def _find_body_part(payload: Dict) -> Optional[Dict]:
+        """
+        Find the part holding the message text in a single walk of the MIME tree
+        
+        Nested multipart parts are searched in document order. The first
+        text/plain part is preferred, the first text/html part is the fallback.
+        Only format='full' responses have parts.
+        """
+        html = None
+        stack = list(reversed(payload.get('parts', [])))
+        while stack:
+            part = stack.pop()
+            mime_type = part.get('mimeType', '')
+            if 'parts' in part:
+                stack.extend(reversed(part['parts']))
+            elif 'text/plain' in mime_type and 'data' in part.get('body', {}):
+                return part
+            elif html is None and 'text/html' in mime_type and 'data' in part.get('body', {}):
+                html = part
+        return html
+
+    @staticmethod
+    def _decode_body(part: Dict) -> str:
+        """Decode the base64url body data of a message part, up to MAX_BODY_BYTES"""
+        if 'body' in part and 'data' in part['body']:
+            # Every 4 base64 characters decode to 3 bytes
+            data = part['body']['data'][:MAX_BODY_BYTES // 3 * 4]
+            return urlsafe_b64decode(data).decode('utf-8', errors='ignore')
+        return ''
+
+    def get_labels(self) -> List[Dict]:
+        """
+        Get all labels of the account
+        
+        The label list is requested once and cached. Labels created or
+        deleted through this class keep the cache up to date.
+        
+        Returns:
+            List of label objects
+        """
+        return list(self._get_labels_by_name().values())
+
+    def invalidate_labels(self) -> None:
+        """Drop the cached label list so the next lookup requests it again"""
+        self._labels_by_name = None
+
+    def _get_labels_by_name(self) -> Dict[str, Dict]:
+        """Get the cached mapping of label name to label object"""
+        if self._labels_by_name is None:
+            results = self.service.users().labels().list(
+                userId='me',
+                fields='labels(id,name)'
+            ).execute(num_retries=NUM_RETRIES)
+            self._labels_by_name = {label['name']: label for label in results.get('labels', [])}
+        return self._labels_by_name
+
     def create_label(self, name: str, parent_label_id: Optional[str] = None) -> Optional[Dict]:
         """
         Create a Gmail label with proper error handling
@@ -92,12 +244,10 @@ class GmailUtils:
         """
         try:
             # First check if label exists
-            existing_labels = self.service.users().labels().list(userId='me').execute()
             full_name = f"{parent_label_id}/{name}" if parent_label_id else name
-            
-            for label in existing_labels.get('labels', []):
-                if label['name'] == full_name:
-                    return label
+            labels = self._get_labels_by_name()
+            if full_name in labels:
+                return labels[full_name]
 
             # Create new label
             label_object = {
@@ -109,13 +259,48 @@ class GmailUtils:
             result = self.service.users().labels().create(
                 userId='me',
                 body=label_object
-            ).execute()
+            ).execute(num_retries=NUM_RETRIES)
+            labels[full_name] = result
             return result
             
         except Exception as e:
-            print(f"Error creating label {name}: {str(e)}")
+            logger.error(f"Error creating label {name}: {str(e)}")
             return None
 
+    def delete_labels(self, label_ids: List[str]) -> int:
+        """
+        Delete many labels using batched HTTP requests
+        
+        Args:
+            label_ids: IDs of the labels to delete
+            
+        Returns:
+            Number of labels deleted
+        """
+        deleted = 0
+
+        def callback(request_id: str, response: Dict, exception: Optional[Exception]) -> None:
+            nonlocal deleted
+            if exception is not None:
+                logger.error(f"Error deleting label {request_id}: {str(exception)}")
+            else:
+                deleted += 1
+
+        for start in range(0, len(label_ids), BATCH_SIZE):
+            batch = self.service.new_batch_http_request(callback=callback)
+            for label_id in label_ids[start:start + BATCH_SIZE]:
+                batch.add(
+                    self.service.users().labels().delete(userId='me', id=label_id),
+                    request_id=label_id
+                )
+            try:
+                batch.execute()
+            except (HttpError, *TRANSPORT_ERRORS) as e:
+                logger.error(f"Gmail API error executing batch: {str(e)}")
+
+        self.invalidate_labels()
+        return deleted
+
     def apply_label(self, message_id: str, label_id: str) -> bool:
         """
         Apply a label to an email
@@ -132,12 +317,56 @@ class GmailUtils:
                 userId='me',
                 id=message_id,
                 body={'addLabelIds': [label_id]}
-            ).execute()
+            ).execute(num_retries=NUM_RETRIES)
+            return True
+        except Exception as e:
+            logger.error(f"Error applying label to message {message_id}: {str(e)}")
+            return False
+
+    def apply_label_bulk(self, message_ids: List[str], label_id: str) -> bool:
+        """
+        Apply a label to many emails using batchModify
+        
+        Args:
+            message_ids: IDs of the messages to label
+            label_id: ID of the label to apply
+            
+        Returns:
+            Boolean indicating success
+        """
+        try:
+            self._batch_modify(message_ids, {'addLabelIds': [label_id]})
             return True
         except Exception as e:
-            print(f"Error applying label to message {message_id}: {str(e)}")
+            logger.error(f"Error applying label to {len(message_ids)} messages: {str(e)}")
             return False
 
+    def remove_label_bulk(self, message_ids: List[str], label_id: str) -> bool:
+        """
+        Remove a label from many emails using batchModify
+        
+        Args:
+            message_ids: IDs of the messages to modify
+            label_id: ID of the label to remove
+            
+        Returns:
+            Boolean indicating success
+        """
+        try:
+            self._batch_modify(message_ids, {'removeLabelIds': [label_id]})
+            return True
+        except Exception as e:
+            logger.error(f"Error removing label from {len(message_ids)} messages: {str(e)}")
+            return False
+
+    def _batch_modify(self, message_ids: List[str], changes: Dict[str, List[str]]) -> None:
+        """Send label changes for many messages, MODIFY_BATCH_SIZE IDs per request"""
+        for start in range(0, len(message_ids), MODIFY_BATCH_SIZE):
+            self.service.users().messages().batchModify(
+                userId='me',
+                body={'ids': message_ids[start:start + MODIFY_BATCH_SIZE], **changes}
+            ).execute(num_retries=NUM_RETRIES)
+
     def remove_label(self, message_id: str, label_id: str) -> bool:
         """
         Remove a label from an email
@@ -154,13 +383,13 @@ class GmailUtils:
                 userId='me',
                 id=message_id,
                 body={'removeLabelIds': [label_id]}
-            ).execute()
+            ).execute(num_retries=NUM_RETRIES)
             return True
         except Exception as e:
-            print(f"Error removing label from message {message_id}: {str(e)}")
+            logger.error(f"Error removing label from message {message_id}: {str(e)}")
             return False
 
-    def get_messages_with_label(self, label_id: str, max_results: Optional[int] = None) -> Set[str]:
+    def get_messages_with_label(self, label_id: str, max_results: Optional[int] = None) -> List[str]:
         """
         Get all message IDs with a specific label
         
@@ -169,25 +398,26 @@ class GmailUtils:
             max_results: Optional maximum number of results to return
             
         Returns:
-            Set of message IDs
+            List of message IDs
         """
-        messages = set()
+        messages = []
         try:
             page_token = None
             while True:
                 results = self.service.users().messages().list(
                     userId='me',
                     labelIds=[label_id],
-                    maxResults=min(500, max_results) if max_results else 500,
-                    pageToken=page_token
-                ).execute()
+                    maxResults=min(500, max_results - len(messages)) if max_results else 500,
+                    pageToken=page_token,
+                    fields='messages/id,nextPageToken'
+                ).execute(num_retries=NUM_RETRIES)
                 
-                if 'messages' in results:
-                    messages.update(msg['id'] for msg in results['messages'])
-                    
-                    # Check if we've reached max_results
-                    if max_results and len(messages) >= max_results:
-                        return set(list(messages)[:max_results])
+                # Gmail does not repeat IDs across pages
+                messages.extend(msg['id'] for msg in results.get('messages', []))
+                
+                # Check if we've reached max_results
+                if max_results and len(messages) >= max_results:
+                    return messages[:max_results]
                 
                 page_token = results.get('nextPageToken')
                 if not page_token:
@@ -196,8 +426,8 @@ class GmailUtils:
             return messages
             
         except Exception as e:
-            print(f"Error getting messages for label {label_id}: {str(e)}")
-            return set()
+            logger.error(f"Error getting messages for label {label_id}: {str(e)}")
+            return []
 
     def get_or_create_label(self, name: str, parent_label_id: Optional[str] = None) -> Optional[Dict]:
         """
@@ -212,56 +442,59 @@ class GmailUtils:
         """
         try:
             # First try to get existing label
-            existing_labels = self.service.users().labels().list(userId='me').execute()
             full_name = f"{parent_label_id}/{name}" if parent_label_id else name
-            
-            for label in existing_labels.get('labels', []):
-                if label['name'] == full_name:
-                    return label
+            labels = self._get_labels_by_name()
+            if full_name in labels:
+                return labels[full_name]
             
             # If not found, create new label
             return self.create_label(name, parent_label_id)
             
         except Exception as e:
-            print(f"Error getting/creating label {name}: {str(e)}")
+            logger.error(f"Error getting/creating label {name}: {str(e)}")
             return None
 
     def get_all_messages(self, label_ids: Optional[List[str]] = None, 
-                        max_results: Optional[int] = None) -> Set[str]:
+                        max_results: Optional[int] = None,
+                        query: Optional[str] = None) -> Iterator[str]:
         """
-        Get all message IDs matching specified criteria
+        Iterate over message IDs matching specified criteria
+        
+        Pages are requested lazily, so callers can start working on the
+        first IDs while later pages have not been fetched yet.
         
         Args:
             label_ids: Optional list of label IDs to filter by
             max_results: Optional maximum number of results to return
+            query: Optional Gmail search query, e.g. '-label:work'
             
-        Returns:
-            Set of message IDs
+        Yields:
+            Message IDs
         """
-        messages = set()
+        count = 0
         try:
             page_token = None
             while True:
                 results = self.service.users().messages().list(
                     userId='me',
                     labelIds=label_ids,
-                    maxResults=min(500, max_results) if max_results else 500,
-                    pageToken=page_token
-                ).execute()
+                    q=query,
+                    maxResults=min(500, max_results - count) if max_results else 500,
+                    pageToken=page_token,
+                    fields='messages/id,nextPageToken'
+                ).execute(num_retries=NUM_RETRIES)
                 
-                if 'messages' in results:
-                    messages.update(msg['id'] for msg in results['messages'])
+                for msg in results.get('messages', []):
+                    yield msg['id']
+                    count += 1
                     
                     # Check if we've reached max_results
-                    if max_results and len(messages) >= max_results:
-                        return set(list(messages)[:max_results])
+                    if max_results and count >= max_results:
+                        return
                 
                 page_token = results.get('nextPageToken')
                 if not page_token:
                     break
-                    
-            return messages
             
         except Exception as e:
-            print(f"Error getting messages: {str(e)}")
-            return set()
\ No newline at end of file
+            logger.error(f"Error getting messages: {str(e)}")
@@ -0,0 +1,22 @@
+from itertools import islice
+from typing import Iterable, Iterator, List, TypeVar
+
+T = TypeVar('T')
+
+def chunked(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    """
+    Split an iterable into lists of at most size items
+    
+    Args:
+        iterable: Items to split, consumed lazily
+        size: Maximum number of items per chunk
+        
+    Yields:
+        Consecutive chunks of items
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
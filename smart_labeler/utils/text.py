@@ -0,0 +1,38 @@
+import html
+import re
+
+# Rough number of characters per token for English text with OpenAI tokenizers
+CHARS_PER_TOKEN = 4
+
+_HIDDEN_HTML_RE = re.compile(r'<(script|style|head)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+_TAG_RE = re.compile(r'<[^>]+>')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+def compact_body(body: str, max_tokens: int = 80) -> str:
+    """
+    Reduce an email body to a short plain-text excerpt for prompts
+    
+    Args:
+        body: Plain text or HTML email body, or Gmail's HTML-escaped snippet
+        max_tokens: Approximate token budget for the excerpt
+        
+    Returns:
+        Body with HTML removed, whitespace collapsed and cut at a word
+        boundary within the budget
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    text = body
+    if '<' in text:
+        text = _TAG_RE.sub(' ', _HIDDEN_HTML_RE.sub(' ', text))
+    if '&' in text:
+        text = html.unescape(text)
+    text = _WHITESPACE_RE.sub(' ', text).strip()
+
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(' ', 0, max_chars + 1)
+    return text[:cut if cut > 0 else max_chars]
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in text without a tokenizer"""
+    return len(text) // CHARS_PER_TOKEN + 1
@@ -0,0 +1,112 @@
+import sys
+import time
+
+import pytest
+
+from smart_labeler.cache import INITIAL_CAPACITY, ClassificationCache, SemanticCache
+
+EMAIL = {'id': '1', 'from': 'shop@example.com', 'subject': 'Your order', 'body': 'Thanks'}
+
+@pytest.fixture
+def db_path(tmp_path):
+    return tmp_path / 'cache' / 'test.db'
+
+def test_classification_cache_round_trip(db_path):
+    cache = ClassificationCache(db_path, model='m', prompt_version='p')
+    key = cache.key(EMAIL)
+    assert cache.get(key) is None
+
+    cache.put(key, 'shopping')
+    assert cache.get(key) == 'shopping'
+    cache.close()
+
+    reopened = ClassificationCache(db_path, model='m', prompt_version='p')
+    assert reopened.get(key) == 'shopping'
+    reopened.close()
+
+def test_classification_cache_key_depends_on_model_and_prompt(db_path):
+    first = ClassificationCache(db_path, model='m', prompt_version='p')
+    key = first.key(EMAIL)
+    first.close()
+
+    other_model = ClassificationCache(db_path, model='m2', prompt_version='p')
+    assert other_model.key(EMAIL) != key
+    other_model.close()
+
+@pytest.mark.parametrize('model, prompt_version', [('m2', 'p'), ('m', 'p2')])
+def test_classification_cache_invalidated_on_change(db_path, model, prompt_version):
+    cache = ClassificationCache(db_path, model='m', prompt_version='p')
+    key = cache.key(EMAIL)
+    cache.put(key, 'shopping')
+    cache.close()
+
+    changed = ClassificationCache(db_path, model=model, prompt_version=prompt_version)
+    count = changed._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+    changed.close()
+    assert count == 0
+
+def test_classification_cache_expires_entries(db_path, monkeypatch):
+    cache = ClassificationCache(db_path, model='m', prompt_version='p', max_age=60)
+    key = cache.key(EMAIL)
+    cache.put(key, 'shopping')
+
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 61)
+    assert cache.get(key) is None
+    cache.close()
+
+    reopened = ClassificationCache(db_path, model='m', prompt_version='p', max_age=60)
+    count = reopened._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+    reopened.close()
+    assert count == 0
+
+def test_semantic_cache_reuses_similar_embeddings(db_path):
+    cache = SemanticCache(db_path, model='m', prompt_version='p', threshold=0.9)
+    assert cache.lookup([1.0, 0.0]) is None
+
+    cache.add([1.0, 0.0], 'shopping')
+    assert cache.lookup([0.99, 0.05]) == 'shopping'
+    assert cache.lookup([0.0, 1.0]) is None
+    # Embeddings of another size are ignored rather than compared
+    assert cache.lookup([1.0, 0.0, 0.0]) is None
+    cache.close()
+
+def test_semantic_cache_persists_and_grows(db_path):
+    cache = SemanticCache(db_path, model='m', prompt_version='p', threshold=0.99)
+    count = INITIAL_CAPACITY + 10
+    for index in range(count):
+        vector = [0.0] * count
+        vector[index] = 1.0
+        cache.add(vector, f"category-{index}")
+    cache.close()
+
+    reopened = SemanticCache(db_path, model='m', prompt_version='p', threshold=0.99)
+    last = [0.0] * count
+    last[-1] = 1.0
+    assert reopened.lookup(last) == f"category-{count - 1}"
+    reopened.close()
+
+def test_semantic_cache_invalidated_on_prompt_change(db_path):
+    cache = SemanticCache(db_path, model='m', prompt_version='p')
+    cache.add([1.0, 0.0], 'shopping')
+    cache.close()
+
+    changed = SemanticCache(db_path, model='m', prompt_version='p2')
+    assert changed.lookup([1.0, 0.0]) is None
+    changed.close()
+
+def test_semantic_cache_expires_embeddings(db_path, monkeypatch):
+    cache = SemanticCache(db_path, model='m', prompt_version='p', max_age=60)
+    cache.add([1.0, 0.0], 'shopping')
+    cache.close()
+
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 61)
+    reopened = SemanticCache(db_path, model='m', prompt_version='p', max_age=60)
+    assert reopened.lookup([1.0, 0.0]) is None
+    reopened.close()
+
+def test_semantic_cache_explains_missing_numpy(db_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, 'numpy', None)
+    with pytest.raises(ImportError, match=r'gmail-smart-labeler\[semantic\]'):
+        SemanticCache(db_path, model='m', prompt_version='p')
@@ -0,0 +1,285 @@
+import json
+import logging
+import re
+from types import SimpleNamespace
+
+import httpx
+import pytest
+import yaml
+from openai import APIConnectionError, APITimeoutError
+
+from smart_labeler import core
+from smart_labeler.core import GmailLabeler
+from smart_labeler.utils.gmail import GmailUtils
+
+CATEGORIES = {
+    'categories': {
+        'shopping': {'description': 'Orders and receipts', 'priority': 'medium'},
+        'newsletters': {'description': 'Regular updates', 'priority': 'low'},
+    }
+}
+
+MESSAGES = {
+    'm1': ('Shop <orders@shop.com>', 'Order 1001 shipped'),
+    'm2': ('Shop <orders@shop.com>', 'Order 1002 shipped'),
+    'm3': ('News <digest@news.com>', 'Weekly digest'),
+}
+
+class FakeRequest:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self, num_retries=0):
+        return self.result()
+
+class FakeBatch:
+    def __init__(self, callback):
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        for request_id, request in self.requests:
+            self.callback(request_id, request.execute(), None)
+
+class FakeGmailService:
+    """Gmail service with just enough of the API for GmailLabeler.label"""
+    def __init__(self, messages):
+        self.messages_by_id = messages
+        self.label_list = [{'id': 'L0', 'name': core.PARENT_LABEL}]
+        self.applied = {}
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return SimpleNamespace(get=self._get_message, list=self._list_messages, batchModify=self._batch_modify)
+
+    def new_batch_http_request(self, callback):
+        return FakeBatch(callback)
+
+    def _get_message(self, userId, id, format, fields, metadataHeaders=None):
+        sender, subject = self.messages_by_id[id]
+        return FakeRequest(lambda: {
+            'snippet': f"About {subject}",
+            'payload': {'headers': [{'name': 'From', 'value': sender}, {'name': 'Subject', 'value': subject}]}
+        })
+
+    def _list_messages(self, userId, labelIds=None, q=None, maxResults=None, pageToken=None, fields=None):
+        return FakeRequest(lambda: {
+            'messages': [{'id': message_id} for message_id in self.messages_by_id if message_id not in self.applied]
+        })
+
+    def _batch_modify(self, userId, body):
+        def modify():
+            for message_id in body['ids']:
+                self.applied[message_id] = body['addLabelIds'][0]
+            return {}
+        return FakeRequest(modify)
+
+    def labels(self):
+        return SimpleNamespace(list=self._list_labels, create=self._create_label)
+
+    def _list_labels(self, userId, fields=None):
+        return FakeRequest(lambda: {'labels': list(self.label_list)})
+
+    def _create_label(self, userId, body):
+        def create():
+            label = {'id': f"L{len(self.label_list)}", 'name': body['name']}
+            self.label_list.append(label)
+            return label
+        return FakeRequest(create)
+
+    def applied_names(self):
+        names = {label['id']: label['name'] for label in self.label_list}
+        return {message_id: names[label_id] for message_id, label_id in self.applied.items()}
+
+class FakeOpenAI:
+    """OpenAI client answering by subject: orders are shopping, anything else newsletters"""
+    def __init__(self):
+        self.chat_calls = 0
+        self.fail_batches = False
+        self.batch_error = RuntimeError("batch request failed")
+        self.single_answer = None
+        self.batch_status = 'completed'
+        # Batch API output lines are answered with status 400 for these custom IDs
+        self.failed_lines = set()
+        self.batch_answer = None
+        self.batch_input = ''
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self.files = SimpleNamespace(create=self._create_file, content=self._file_content)
+        self.batches = SimpleNamespace(create=self._create_batch)
+
+    def with_options(self, **kwargs):
+        return self
+
+    def _create(self, **kwargs):
+        self.chat_calls += 1
+        return self._respond(**kwargs)
+
+    def _respond(self, **kwargs):
+        prompt = kwargs['messages'][-1]['content']
+        if kwargs.get('response_format'):
+            if self.fail_batches:
+                raise self.batch_error
+            subjects = re.findall(r'^\d+\. From: .*? \| Subject: (.*?) \| Body:', prompt, re.MULTILINE)
+            content = json.dumps({str(number): self._category(subject)
+                                  for number, subject in enumerate(subjects, start=1)})
+        else:
+            content = self.single_answer or self._category(re.search(r'Subject: (.*)', prompt).group(1))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+    def _create_file(self, file, purpose):
+        self.batch_input = file[1].decode('utf-8')
+        return SimpleNamespace(id='file-1')
+
+    def _create_batch(self, **kwargs):
+        output_file_id = 'file-2' if self.batch_status == 'completed' else None
+        return SimpleNamespace(id='batch-1', status=self.batch_status, output_file_id=output_file_id)
+
+    def _file_content(self, file_id):
+        lines = []
+        for line in self.batch_input.splitlines():
+            request = json.loads(line)
+            if request['custom_id'] in self.failed_lines:
+                response = {'status_code': 400, 'body': {}}
+            else:
+                content = self.batch_answer or self._respond(**request['body']).choices[0].message.content
+                response = {'status_code': 200, 'body': {'choices': [{'message': {'content': content}}]}}
+            lines.append(json.dumps({'custom_id': request['custom_id'], 'response': response}))
+        return SimpleNamespace(text='\n'.join(lines))
+
+    @staticmethod
+    def _category(subject):
+        return 'shopping' if subject.startswith('Order') else 'newsletters'
+
+REQUEST = httpx.Request('POST', 'https://api.openai.com/v1/chat/completions')
+
+@pytest.fixture
+def labeler(tmp_path, monkeypatch):
+    config_path = tmp_path / 'categories.yaml'
+    config_path.write_text(yaml.safe_dump(CATEGORIES))
+    monkeypatch.setattr(core, 'CONFIG_PATH', config_path)
+
+    labeler = GmailLabeler.__new__(GmailLabeler)
+    labeler.user_config_dir = tmp_path / 'user'
+    labeler.logger = logging.getLogger('test_smart_labeler')
+    labeler.openai = FakeOpenAI()
+    labeler.classifier_model = core.CLASSIFIER_MODEL
+    labeler.rate_limiter = None
+    labeler.cache = None
+    labeler.semantic_cache = None
+    labeler.gmail_service = FakeGmailService(MESSAGES)
+    labeler.gmail_utils = GmailUtils(labeler.gmail_service)
+    return labeler
+
+def test_match_category(labeler):
+    valid = {'shopping': 'shopping', 'security-alerts': 'Security-Alerts'}
+    assert labeler._match_category(' "Security-alerts." ', valid) == 'Security-Alerts'
+    assert labeler._match_category('Personal', valid) is None
+    assert labeler._match_category(None, valid) is None
+
+def test_group_emails_by_sender_address():
+    emails = [
+        {'id': '1', 'from': 'Ann <ann@gmail.com>', 'subject': 'Invoice 12'},
+        {'id': '2', 'from': 'ANN@gmail.com', 'subject': 'Invoice 13'},
+        {'id': '3', 'from': 'bob@gmail.com', 'subject': 'Invoice 14'},
+    ]
+    groups = GmailLabeler._group_emails(emails)
+    assert sorted(len(members) for members in groups.values()) == [1, 2]
+
+def test_label_applies_categories(labeler):
+    stats = labeler.label(concurrency=2)
+
+    assert stats == {'processed': 3, 'labeled': 3, 'errors': 0}
+    # Both order emails are classified through one representative, in one request
+    assert labeler.openai.chat_calls == 1
+    assert labeler.gmail_service.applied_names() == {
+        'm1': f"{core.PARENT_LABEL}/shopping",
+        'm2': f"{core.PARENT_LABEL}/shopping",
+        'm3': f"{core.PARENT_LABEL}/newsletters",
+    }
+
+def test_label_reuses_cached_categories(labeler):
+    labeler.label(dry_run=True)
+    calls = labeler.openai.chat_calls
+
+    stats = labeler.label(dry_run=True)
+    assert stats == {'processed': 3, 'labeled': 0, 'errors': 0}
+    assert labeler.openai.chat_calls == calls
+    assert labeler.gmail_service.applied == {}
+
+def test_unknown_answer_is_not_cached(labeler):
+    labeler.openai.fail_batches = True
+    labeler.openai.single_answer = 'Personal'
+    assert labeler.label(dry_run=True)['labeled'] == 0
+
+    labeler.openai.fail_batches = False
+    labeler.openai.single_answer = None
+    calls = labeler.openai.chat_calls
+    assert labeler.label()['labeled'] == 3
+    assert labeler.openai.chat_calls > calls
+
+def test_failed_batch_job_counts_errors(labeler):
+    labeler.openai.batch_status = 'failed'
+
+    stats = labeler.label(batch_api=True)
+    assert stats == {'processed': 0, 'labeled': 0, 'errors': 3}
+
+def test_batch_api_labels_emails(labeler):
+    stats = labeler.label(batch_api=True)
+    assert stats == {'processed': 3, 'labeled': 3, 'errors': 0}
+    assert labeler.openai.chat_calls == 0
+
+def test_failed_batch_lines_are_not_classified_one_by_one(labeler, monkeypatch):
+    monkeypatch.setattr(core, 'CLASSIFY_BATCH_SIZE', 1)
+    labeler.openai.failed_lines = {'batch-1'}
+
+    stats = labeler.label(batch_api=True)
+    assert stats == {'processed': 2, 'labeled': 2, 'errors': 1}
+    assert labeler.openai.chat_calls == 0
+
+def test_unusable_batch_answer_does_not_abort_label(labeler):
+    labeler.openai.batch_answer = '["shopping", "newsletters"]'
+
+    stats = labeler.label(batch_api=True)
+    assert stats == {'processed': 0, 'labeled': 0, 'errors': 3}
+
+def test_batch_api_refused_in_dry_run(labeler):
+    with pytest.raises(ValueError):
+        labeler.label(dry_run=True, batch_api=True)
+
+def test_call_openai_retries_transient_errors(labeler, monkeypatch):
+    monkeypatch.setattr(core.time, 'sleep', lambda seconds: None)
+    outcomes = [APIConnectionError(request=REQUEST), APITimeoutError(request=REQUEST), 'ok']
+
+    def create():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert labeler._call_openai(create) == 'ok'
+
+def test_call_openai_bounds_timeout_retries(labeler, monkeypatch):
+    monkeypatch.setattr(core.time, 'sleep', lambda seconds: None)
+    calls = []
+
+    def create():
+        calls.append(1)
+        raise APITimeoutError(request=REQUEST)
+
+    with pytest.raises(APITimeoutError):
+        labeler._call_openai(create)
+    assert len(calls) == core.TIMEOUT_RETRIES + 1
+
+def test_unavailable_openai_skips_per_email_fallback(labeler, monkeypatch):
+    monkeypatch.setattr(core.time, 'sleep', lambda seconds: None)
+    labeler.openai.fail_batches = True
+    labeler.openai.batch_error = APIConnectionError(request=REQUEST)
+
+    assert labeler.label()['labeled'] == 0
+    # Every attempt went to the one batch request, none to single emails
+    assert labeler.openai.chat_calls == core.RETRY_ATTEMPTS
@@ -0,0 +1,95 @@
+from base64 import urlsafe_b64encode
+import socket
+from types import SimpleNamespace
+
+import httplib2
+import pytest
+
+from smart_labeler.utils.gmail import GmailUtils
+
+def metadata_message(snippet='', **headers):
+    """Build a message resource as returned by a format='metadata' fetch"""
+    return {
+        'snippet': snippet,
+        'payload': {
+            'headers': [{'name': name.replace('_', '-'), 'value': value} for name, value in headers.items()]
+        }
+    }
+
+def parse(message):
+    return GmailUtils(service=None)._parse_message('m1', message)
+
+def test_parse_metadata_message():
+    email = parse(metadata_message('Your order has shipped', From='Shop <shop@example.com>', Subject='Order 1'))
+    assert email == {
+        'id': 'm1',
+        'subject': 'Order 1',
+        'from': 'Shop <shop@example.com>',
+        'body': 'Your order has shipped',
+        'bulk': False
+    }
+
+def test_parse_metadata_message_defaults():
+    email = parse(metadata_message())
+    assert email['subject'] == 'No Subject'
+    assert email['from'] == 'No Sender'
+    assert email['body'] == 'No Content'
+
+def test_parse_metadata_message_keeps_snippet_escaped():
+    assert parse(metadata_message('3 &lt; 5'))['body'] == '3 &lt; 5'
+
+def test_parse_metadata_message_detects_bulk_mail():
+    assert parse(metadata_message(List_Unsubscribe='<mailto:unsubscribe@example.com>'))['bulk']
+    assert parse(metadata_message(Precedence='Bulk'))['bulk']
+    assert not parse(metadata_message(Precedence='first-class'))['bulk']
+
+def test_parse_full_message_prefers_plain_text():
+    def part(mime_type, text):
+        return {'mimeType': mime_type, 'body': {'data': urlsafe_b64encode(text.encode()).decode()}}
+
+    message = {
+        'payload': {
+            'mimeType': 'multipart/mixed',
+            'parts': [
+                {'mimeType': 'multipart/alternative', 'parts': [
+                    part('text/html', '<p>html</p>'),
+                    part('text/plain', 'plain'),
+                ]},
+            ]
+        }
+    }
+    assert parse(message)['body'] == 'plain'
+
+class FlakyBatchService:
+    """Gmail service whose batch calls fail with a network error after the first message"""
+    def __init__(self, error):
+        self.error = error
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def get(self, userId, id, format, fields, metadataHeaders=None):
+        return SimpleNamespace(id=id, execute=lambda num_retries=0: metadata_message(f"Snippet {id}"))
+
+    def new_batch_http_request(self, callback):
+        requests = []
+
+        def execute():
+            request_id, request = requests[0]
+            callback(request_id, request.execute(), None)
+            raise self.error
+
+        return SimpleNamespace(add=lambda request, request_id: requests.append((request_id, request)),
+                               execute=execute)
+
+@pytest.mark.parametrize('error', [ConnectionResetError(), socket.timeout(), httplib2.ServerNotFoundError()])
+def test_batch_transport_error_retries_unfinished_messages(error):
+    emails = GmailUtils(FlakyBatchService(error)).get_email_contents_batch(['m1', 'm2', 'm3'], format='metadata')
+    assert {message_id: email['body'] for message_id, email in emails.items()} == {
+        'm1': 'Snippet m1',
+        'm2': 'Snippet m2',
+        'm3': 'Snippet m3',
+    }
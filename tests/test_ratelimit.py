@@ -0,0 +1,64 @@
+import pytest
+
+from smart_labeler import ratelimit
+from smart_labeler.ratelimit import RateLimiter
+
+class FakeClock:
+    """Stand-in for the time module that advances only when slept on"""
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(ratelimit, 'time', fake)
+    return fake
+
+def test_requests_are_spaced_by_the_rate(clock):
+    limiter = RateLimiter(requests_per_minute=60)
+    limiter.acquire()
+    assert clock.sleeps == []
+
+    limiter.acquire()
+    assert sum(clock.sleeps) == pytest.approx(1.0)
+
+def test_tokens_wait_for_refill(clock):
+    limiter = RateLimiter(tokens_per_minute=600)
+    limiter.acquire(10)
+    assert clock.sleeps == []
+
+    limiter.acquire(5)
+    assert sum(clock.sleeps) == pytest.approx(0.5)
+
+def test_oversized_request_leaves_debt(clock):
+    limiter = RateLimiter(tokens_per_minute=60)
+    limiter.acquire(100)
+    assert clock.sleeps == []
+
+    # 99 tokens of debt plus the one requested, refilled at one per second
+    limiter.acquire(1)
+    assert sum(clock.sleeps) == pytest.approx(100.0)
+
+def test_idle_time_refills_up_to_capacity(clock):
+    limiter = RateLimiter(requests_per_minute=60)
+    limiter.acquire()
+    clock.now += 30
+    limiter.acquire()
+    assert clock.sleeps == []
+
+    limiter.acquire()
+    assert sum(clock.sleeps) == pytest.approx(1.0)
+
+def test_no_limits_never_waits(clock):
+    limiter = RateLimiter()
+    for _ in range(100):
+        limiter.acquire(10_000)
+    assert clock.sleeps == []
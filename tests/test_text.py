@@ -0,0 +1,21 @@
+from smart_labeler.utils.text import CHARS_PER_TOKEN, compact_body, estimate_tokens
+
+def test_compact_body_strips_html():
+    body = (
+        '<html><head><title>Ignored</title></head>'
+        '<style>p { color: red; }</style><script>track()</script>'
+        '<body><p>Your   order</p><br>has shipped</body></html>'
+    )
+    assert compact_body(body) == 'Your order has shipped'
+
+def test_compact_body_unescapes_after_stripping_tags():
+    assert compact_body('3 &lt; 5 and 7 &gt; 2 &amp; co') == '3 < 5 and 7 > 2 & co'
+
+def test_compact_body_cuts_at_word_boundary():
+    excerpt = compact_body('word ' * 100, max_tokens=10)
+    assert len(excerpt) <= 10 * CHARS_PER_TOKEN
+    assert excerpt.split() == ['word'] * len(excerpt.split())
+
+def test_estimate_tokens():
+    assert estimate_tokens('') == 1
+    assert estimate_tokens('a' * 400) == 400 // CHARS_PER_TOKEN + 1